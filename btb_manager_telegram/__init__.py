@@ -9,6 +9,7 @@
     CUSTOM_SCRIPT,
     GRAPH_MENU,
     CREATE_GRAPH,
-) = range(10)
+    PRUNE_SCOUTS,
+) = range(11)
 
 BOUGHT, BUYING, SOLD, SELLING = range(4)
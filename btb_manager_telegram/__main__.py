@@ -1,7 +1,9 @@
 import argparse
 import datetime as dt
+import hashlib
 import json
 import os
+import socket
 import subprocess
 import sys
 import time
@@ -21,15 +23,26 @@ from btb_manager_telegram import (
     GRAPH_MENU,
     MENU,
     PANIC_BUTTON,
+    PRUNE_SCOUTS,
     UPDATE_BTB,
     UPDATE_TG,
     settings,
 )
 from btb_manager_telegram.buttons import start_bot
+from btb_manager_telegram.db_pool import db_replica, query_stats
+from btb_manager_telegram.db_watcher import db_watcher
 from btb_manager_telegram.formating import escape_tg
+from btb_manager_telegram.graph_renderer import graph_renderer
 from btb_manager_telegram.logging import logger, tg_error_handler
-from btb_manager_telegram.report import make_snapshot, migrate_reports
+from btb_manager_telegram.outbox import outbox
+from btb_manager_telegram.report import (
+    compact_reports,
+    make_snapshot,
+    migrate_reports,
+)
+from btb_manager_telegram.report_store import parse_retention
 from btb_manager_telegram.schedule import scheduler
+from btb_manager_telegram.trade_notifier import check_new_trades
 from btb_manager_telegram.utils import (
     get_restart_file_name,
     retreive_btb_constants,
@@ -92,6 +105,126 @@ def pre_run_main() -> None:
         help="openexchangerates.org api key. Mandatory if CURRENCY is not EUR or USD. Get yours here : https://openexchangerates.org/signup/free",
         default=None,
     )
+    parser.add_argument(
+        "--reports_sync",
+        type=str,
+        choices=["off", "normal", "full"],
+        help="(optional) When the snapshot store syncs to disk. 'full' fsyncs every snapshot, 'normal' relies on the write-ahead log checkpoints, 'off' leaves it to the OS.",
+        default="normal",
+    )
+    parser.add_argument(
+        "--prerender_graphs",
+        type=int,
+        help="(optional) Number of favourite graphs rendered in advance after each snapshot.",
+        default=3,
+    )
+    parser.add_argument(
+        "--graph_points",
+        type=int,
+        help="(optional) Maximum number of points drawn per line in the graphs, peaks and drawdowns are kept. Set to 0 to draw every point.",
+        default=1000,
+    )
+    parser.add_argument(
+        "--price_ttl",
+        type=float,
+        help="(optional) Number of seconds during which the binance prices shown by the buttons are reused.",
+        default=10,
+    )
+    parser.add_argument(
+        "--binance_weight_limit",
+        type=int,
+        help="(optional) Request weight per minute the manager may use on the binance api. Snapshots only use half of it and the buttons 80%%, the rest is kept for the panic button.",
+        default=6000,
+    )
+    parser.add_argument(
+        "--binance_api_url",
+        type=str,
+        help="(optional) Base url of the binance api, e.g. to use a local stub server. Defaults to https://api.binance.<tld>.",
+        default=None,
+    )
+    parser.add_argument(
+        "--report_retention",
+        type=str,
+        help="(optional) Retention tiers of the snapshots, e.g. '30d:4h,365d:1d' keeps one snapshot every 4 hours after 30 days and one every day after a year. By default every snapshot is kept.",
+        default="",
+    )
+    parser.add_argument(
+        "--scout_retention_days",
+        type=int,
+        help="(optional) Number of days of scout history kept by the 'Prune scout history' maintenance button.",
+        default=7,
+    )
+    parser.add_argument(
+        "--scout_keep_hourly",
+        action="store_true",
+        help="(optional) When pruning the scout history, keep the last scout per pair and per hour of the older scouts instead of deleting them.",
+    )
+    parser.add_argument(
+        "--db_replica_interval",
+        type=int,
+        help="(optional) When set, the buttons read a copy of the trade bot database checked every this many seconds and copied again if it changed, at most once a minute, instead of the live database. Disabled by default.",
+        default=0,
+    )
+    parser.add_argument(
+        "--db_watch_interval",
+        type=float,
+        help="(optional) Interval in seconds at which the trade bot database is checked for changes. The progress and trade history buttons are answered from memory until it changes. 0 to disable.",
+        default=1,
+    )
+    parser.add_argument(
+        "--trade_notify_interval",
+        type=int,
+        help="(optional) Interval in seconds at which new trades are looked for, when the trade notifications are enabled from the configurations menu. The trades completed meanwhile are sent in a single message. 0 to disable.",
+        default=30,
+    )
+    parser.add_argument(
+        "--webhook",
+        type=str,
+        help="(optional) Public HTTPS URL of a reverse proxy forwarding to the local webhook listener. When set, the updates are received through a webhook instead of polling. Falls back to polling if the webhook cannot be set up.",
+        default=None,
+    )
+    parser.add_argument(
+        "--webhook_listen",
+        type=str,
+        help="(optional) Address of the local webhook listener.",
+        default="127.0.0.1",
+    )
+    parser.add_argument(
+        "--webhook_port",
+        type=int,
+        help="(optional) Port of the local webhook listener.",
+        default=8080,
+    )
+    parser.add_argument(
+        "--webhook_path",
+        type=str,
+        help="(optional) Path of the webhook, appended to the URL. Defaults to a secret derived from the telegram token.",
+        default=None,
+    )
+    parser.add_argument(
+        "--bot_api_url",
+        type=str,
+        help="(optional) Base URL of the telegram Bot API, e.g. a local Bot API server. The token is appended to it.",
+        default=None,
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="(optional) Number of threads handling the telegram updates.",
+        default=4,
+    )
+    parser.add_argument(
+        "--con_pool_size",
+        type=int,
+        help="(optional) Size of the connection pool to the telegram Bot API. Defaults to the number of workers + 4.",
+        default=None,
+    )
+    parser.add_argument(
+        "--job_workers",
+        type=int,
+        help="(optional) Number of threads running the slow actions, such as the bot stats or the database export.",
+        default=2,
+    )
     parser.add_argument(
         "-d",
         "--docker",
@@ -131,6 +264,26 @@ def pre_run_main() -> None:
     settings.START_TRADE_BOT = args.start_trade_bot
     settings.CURRENCY = args.currency
     settings.OER_KEY = args.oer_key
+    settings.REPORTS_SYNC = args.reports_sync
+    settings.PRERENDER_GRAPHS = args.prerender_graphs
+    settings.GRAPH_POINTS = args.graph_points
+    settings.PRICE_TTL = args.price_ttl
+    settings.BINANCE_API_URL = args.binance_api_url
+    settings.BINANCE_WEIGHT_LIMIT = args.binance_weight_limit
+    settings.REPORT_RETENTION = parse_retention(args.report_retention)
+    settings.SCOUT_RETENTION_DAYS = args.scout_retention_days
+    settings.SCOUT_KEEP_HOURLY = args.scout_keep_hourly
+    settings.DB_REPLICA_INTERVAL = args.db_replica_interval
+    settings.DB_WATCH_INTERVAL = args.db_watch_interval
+    settings.TRADE_NOTIFY_INTERVAL = args.trade_notify_interval
+    settings.WEBHOOK_URL = args.webhook
+    settings.WEBHOOK_LISTEN = args.webhook_listen
+    settings.WEBHOOK_PORT = args.webhook_port
+    settings.WEBHOOK_PATH = args.webhook_path
+    settings.BOT_API_URL = args.bot_api_url
+    settings.WORKERS = args.workers
+    settings.CON_POOL_SIZE = args.con_pool_size
+    settings.JOB_WORKERS = args.job_workers
     settings.RAW_ARGS = [i for i in sys.argv[1:] if "_remove_this_arg_" not in i]
 
     if settings.CURRENCY not in ("USD", "EUR") and (
@@ -148,14 +301,31 @@ def pre_run_main() -> None:
     setup_coin_list()
     if settings.TOKEN is None or settings.CHAT_ID is None:
         setup_telegram_constants()
-    settings.BOT = telegram.Bot(settings.TOKEN)
+    settings.BOT = telegram.Bot(settings.TOKEN, base_url=settings.BOT_API_URL)
     settings.CHAT = settings.BOT.getChat(settings.CHAT_ID)
 
     migrate_reports()
 
     scheduler.exec_periodically(update_checker, dt.timedelta(days=7).total_seconds())
     scheduler.exec_periodically(make_snapshot, dt.timedelta(hours=1).total_seconds())
+    if len(settings.REPORT_RETENTION) > 0:
+        scheduler.exec_periodically(
+            compact_reports, dt.timedelta(hours=1).total_seconds(), priority=2
+        )
+    if settings.DB_REPLICA_INTERVAL > 0:
+        scheduler.exec_periodically(
+            db_replica.refresh, settings.DB_REPLICA_INTERVAL, priority=3
+        )
+    if settings.TRADE_NOTIFY_INTERVAL > 0:
+        scheduler.exec_periodically(check_new_trades, settings.TRADE_NOTIFY_INTERVAL)
+    scheduler.exec_periodically(
+        outbox.log_metrics, dt.timedelta(hours=1).total_seconds()
+    )
+    scheduler.exec_periodically(
+        query_stats.log_stats, dt.timedelta(hours=1).total_seconds()
+    )
     scheduler.start()
+    outbox.start()
 
     return False
 
@@ -184,7 +354,16 @@ def main() -> None:
         message_trade_bot += "\n\n"
 
     # Create the telegram.ext.Updater and pass it your token
-    updater = telegram.ext.Updater(settings.TOKEN)
+    # the updater needs at least workers + 4 connections
+    con_pool_size = settings.CON_POOL_SIZE
+    if con_pool_size is None or con_pool_size < settings.WORKERS + 4:
+        con_pool_size = settings.WORKERS + 4
+    updater = telegram.ext.Updater(
+        settings.TOKEN,
+        base_url=settings.BOT_API_URL,
+        workers=settings.WORKERS,
+        request_kwargs={"con_pool_size": con_pool_size},
+    )
 
     # Get the dispatcher to register handlers
     dispatcher = updater.dispatcher
@@ -206,15 +385,24 @@ def main() -> None:
             CUSTOM_SCRIPT: [handlers.CUSTOM_SCRIPT_HANDLER],
             GRAPH_MENU: [handlers.GRAPH_MENU_HANDLER],
             CREATE_GRAPH: [handlers.CREATE_GRAPH_HANDLER],
+            PRUNE_SCOUTS: [handlers.PRUNE_SCOUTS_HANDLER],
         },
         fallbacks=[handlers.FALLBACK_HANDLER],
         per_user=True,
         allow_reentry=True,
     )
     dispatcher.add_handler(conv_handler)
+    dispatcher.add_handler(handlers.CANCEL_JOB_HANDLER)
+
+    # Start the graph rendering process
+    graph_renderer.start()
+
+    # Watch the trade bot database for changes
+    if settings.DB_WATCH_INTERVAL > 0:
+        db_watcher.start()
 
     # Start the telegram.Bot
-    updater.start_polling()
+    start_updates(updater)
 
     # Welcome mat
 
@@ -235,7 +423,8 @@ def main() -> None:
 
     keyboard = [["/start"]]
     reply_markup = telegram.ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
-    settings.CHAT.send_message(
+    outbox.send(
+        settings.CHAT,
         escape_tg(message),
         reply_markup=reply_markup,
         parse_mode="MarkdownV2",
@@ -249,6 +438,9 @@ def main() -> None:
 
     scheduler.stop()
     scheduler.join()
+    graph_renderer.stop()
+    db_watcher.stop()
+    outbox.stop()
 
     try:
         os.remove("btbmt.pid")
@@ -258,6 +450,50 @@ def main() -> None:
     logger.info("The telegram bot has stopped")
 
 
+def check_port(host, port) -> None:
+    """
+    Raises an OSError if the webhook listener cannot bind to host:port
+    """
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    with socket.socket(family, socket.SOCK_STREAM) as sock:
+        # as the listener does, so that a port in TIME_WAIT is not seen as busy
+        if os.name == "posix":
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+
+
+def start_updates(updater) -> None:
+    """
+    Receives the updates through the webhook if one is configured,
+    by polling otherwise or if the webhook cannot be set up
+    """
+    if settings.WEBHOOK_URL is not None:
+        url_path = settings.WEBHOOK_PATH
+        if url_path is None:
+            url_path = hashlib.sha256(settings.TOKEN.encode()).hexdigest()[:32]
+        url_path = url_path.strip("/")
+        webhook_url = f"{settings.WEBHOOK_URL.rstrip('/')}/{url_path}"
+        try:
+            # start_webhook hangs if its listener cannot start or the webhook
+            # cannot be set, so both are checked beforehand
+            check_port(settings.WEBHOOK_LISTEN, settings.WEBHOOK_PORT)
+            updater.bot.set_webhook(webhook_url)
+        except Exception as e:
+            logger.warning(f"Unable to set up the webhook, polling instead: {e}")
+        else:
+            updater.start_webhook(
+                listen=settings.WEBHOOK_LISTEN,
+                port=settings.WEBHOOK_PORT,
+                url_path=url_path,
+                webhook_url=webhook_url,
+            )
+            logger.info(
+                f"Receiving the updates on {settings.WEBHOOK_LISTEN}:{settings.WEBHOOK_PORT}"
+            )
+            return
+    updater.start_polling()
+
+
 def run_on_docker() -> None:
     try:
         subprocess.run(
@@ -1,9 +1,171 @@
+import collections
+import contextlib
 import hashlib
 import hmac
+import threading
 import time
-from urllib.parse import urlencode
+from urllib.parse import parse_qs, urlencode, urlparse
 
+import binance
 import requests
+import requests.adapters
+
+from btb_manager_telegram import settings
+from btb_manager_telegram.logging import logger
+
+LOW_PRIORITY = 0  # snapshots and other background calls
+NORMAL_PRIORITY = 1  # buttons
+HIGH_PRIORITY = 2  # panic button orders
+
+# share of the weight limit each priority may use, so that
+# there is always some weight left for the more urgent calls
+PRIORITY_SHARES = {LOW_PRIORITY: 0.5, NORMAL_PRIORITY: 0.8, HIGH_PRIORITY: 1.0}
+
+# request weight of the endpoints used by the manager,
+# see https://binance-docs.github.io/apidocs/spot/en/
+ENDPOINT_WEIGHTS = {
+    ("GET", "/api/v3/account"): 20,
+    ("GET", "/api/v3/ticker/price"): 4,
+    ("POST", "/api/v3/order"): 1,
+    ("DELETE", "/api/v3/openOrders"): 1,
+    ("GET", "/api/v3/ping"): 1,
+    ("GET", "/api/v3/time"): 1,
+}
+DEFAULT_WEIGHT = 1
+
+_binance_client = None
+_binance_client_lock = threading.Lock()
+_local = threading.local()
+
+
+def get_api_url(tld=None):
+    """
+    Base url of the binance api, `settings.BINANCE_API_URL` if set
+    (e.g. to point to a local stub server)
+    """
+    if settings.BINANCE_API_URL:
+        return settings.BINANCE_API_URL.rstrip("/")
+    return f"https://api.binance.{settings.TLD if tld is None else tld}"
+
+
+def endpoint_weight(method, path, query):
+    if path == "/api/v3/ticker/price" and "symbol" in query:
+        return 2
+    return ENDPOINT_WEIGHTS.get((method, path), DEFAULT_WEIGHT)
+
+
+@contextlib.contextmanager
+def request_priority(priority):
+    """
+    Run the binance requests made by the current thread with the given priority
+    """
+    previous = getattr(_local, "priority", NORMAL_PRIORITY)
+    _local.priority = priority
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+class WeightLimiter:
+    def __init__(self):
+        """
+        Keeps track of the request weight used during the current
+        minute, as reported by binance in the `X-MBX-USED-WEIGHT-1M`
+        header (which includes the other programs using the same IP).
+        A request waits until the next minute when it would exceed the
+        share of `settings.BINANCE_WEIGHT_LIMIT` allowed for its priority,
+        and as long as a request of higher priority is waiting.
+        """
+        self.cond = threading.Condition()
+        self.minute = None
+        self.used = 0
+        self.banned_until = 0
+        self.waiting = collections.Counter()
+
+    def _refresh(self, now):
+        minute = int(now // 60)
+        if minute != self.minute:
+            self.minute = minute
+            self.used = 0
+
+    def acquire(self, weight, priority):
+        with self.cond:
+            self.waiting[priority] += 1
+            try:
+                while True:
+                    now = time.time()
+                    self._refresh(now)
+                    budget = settings.BINANCE_WEIGHT_LIMIT * PRIORITY_SHARES[priority]
+                    preempted = any(
+                        n > 0 for p, n in self.waiting.items() if p > priority
+                    )
+                    if (
+                        now >= self.banned_until
+                        and not preempted
+                        and self.used + weight <= budget
+                    ):
+                        self.used += weight
+                        return
+                    if now < self.banned_until:
+                        delay = self.banned_until - now
+                    else:
+                        delay = 60 - now % 60
+                    logger.debug(
+                        f"Binance request of weight {weight} delayed, {self.used} used this minute"
+                    )
+                    self.cond.wait(delay)
+            finally:
+                self.waiting[priority] -= 1
+                self.cond.notify_all()
+
+    def update(self, response):
+        """
+        Take the used weight and the bans reported by binance into account
+        """
+        used = response.headers.get("X-MBX-USED-WEIGHT-1M")
+        with self.cond:
+            now = time.time()
+            self._refresh(now)
+            if used is not None and used.isdigit():
+                self.used = max(self.used, int(used))
+            if response.status_code in (418, 429):
+                retry_after = response.headers.get("Retry-After", "60")
+                retry_after = int(retry_after) if retry_after.isdigit() else 60
+                self.banned_until = max(self.banned_until, now + retry_after)
+                logger.warning(
+                    f"Binance rate limit reached (HTTP {response.status_code}), requests paused for {retry_after}s"
+                )
+            self.cond.notify_all()
+
+
+weight_limiter = WeightLimiter()
+
+
+class BinanceAdapter(requests.adapters.HTTPAdapter):
+    """
+    Keep-alive adapter that submits the requests to the binance
+    api to the weight limiter before sending them
+    """
+
+    def send(self, request, **kwargs):
+        if not request.url.startswith(get_api_url()):
+            return super().send(request, **kwargs)
+        url = urlparse(request.url)
+        weight = endpoint_weight(request.method, url.path, parse_qs(url.query))
+        weight_limiter.acquire(weight, getattr(_local, "priority", NORMAL_PRIORITY))
+        response = super().send(request, **kwargs)
+        weight_limiter.update(response)
+        return response
+
+
+# every http call to binance goes through this adapter, so that the
+# connections are kept alive and reused instead of opening a new one
+# (with a new TLS handshake) for each request
+http_adapter = BinanceAdapter(pool_connections=10, pool_maxsize=10)
+http_session = requests.Session()
+http_session.mount("https://", http_adapter)
+http_session.mount("http://", http_adapter)
 
 
 def hashing(secret, query_string):
@@ -16,17 +178,58 @@ def get_timestamp():
     return int(time.time() * 1000)
 
 
+def get_binance_client():
+    """
+    Returns the binance client shared by the whole manager,
+    creating it on first use
+    """
+    global _binance_client
+    with _binance_client_lock:
+        if _binance_client is None:
+            try:
+                # the ping would be sent before the shared adapter is mounted
+                client = binance.Client(
+                    settings.BINANCE_API_KEY,
+                    settings.BINANCE_API_SECRET,
+                    tld=settings.TLD,
+                    ping=False,
+                )
+            except TypeError:
+                # python-binance versions without the `ping` argument
+                client = binance.Client(
+                    settings.BINANCE_API_KEY,
+                    settings.BINANCE_API_SECRET,
+                    tld=settings.TLD,
+                )
+            client.session.mount("https://", http_adapter)
+            client.session.mount("http://", http_adapter)
+            client.API_URL = f"{get_api_url()}/api"
+            _binance_client = client
+        return _binance_client
+
+
+def get_connection_stats():
+    """
+    Returns the number of new and reused http connections
+    since the start of the manager
+    """
+    nb_requests = 0
+    nb_connections = 0
+    pools = http_adapter.poolmanager.pools
+    for key in pools.keys():
+        pool = pools[key]
+        nb_requests += pool.num_requests
+        nb_connections += pool.num_connections
+    return {"new": nb_connections, "reused": nb_requests - nb_connections}
+
+
 def dispatch_request(key, http_method):
-    session = requests.Session()
-    session.headers.update(
-        {"Content-Type": "application/json;charset=utf-8", "X-MBX-APIKEY": key}
-    )
-    return {
-        "GET": session.get,
-        "DELETE": session.delete,
-        "PUT": session.put,
-        "POST": session.post,
-    }.get(http_method, "GET")
+    headers = {"Content-Type": "application/json;charset=utf-8", "X-MBX-APIKEY": key}
+
+    def request(**params):
+        return http_session.request(http_method, headers=headers, **params)
+
+    return request
 
 
 def send_signed_request(key, secret, base_url, http_method, url_path, payload={}):
@@ -39,12 +242,7 @@ def send_signed_request(key, secret, base_url, http_method, url_path, payload={}
     url = f'{base_url}{url_path}?{query_string}&signature="{hashing(secret, query_string)}'
     print(f"{http_method} {url}")
     params = {"url": url, "params": {}}
-    response = dispatch_request(key, http_method)(**params)
+    # orders are only sent by the panic button, they go before anything else
+    with request_priority(HIGH_PRIORITY):
+        response = dispatch_request(key, http_method)(**params)
     return response.json()
-
-
-def get_current_price(ticker, bridge):
-    response = requests.get(
-        f"https://api.binance.com/api/v3/ticker/price?symbol={ticker}{bridge}"
-    ).json()
-    return eval(response["price"])
@@ -1,18 +1,24 @@
 import configparser
 import datetime as dt
 import os
+import shutil
 import sqlite3
 import subprocess
+import tempfile
 import time
 
 import i18n
+import numpy as np
 
-from btb_manager_telegram import BOUGHT, BUYING, SELLING, SOLD, settings
-from btb_manager_telegram.binance_api_utils import get_current_price
+from btb_manager_telegram import BOUGHT, BUYING, SELLING, SOLD, db_tools, settings
+from btb_manager_telegram.db_watcher import cached_until_changed
 from btb_manager_telegram.formating import format_float, telegram_text_truncator
 from btb_manager_telegram.logging import if_exception_log, logger
-from btb_manager_telegram.report import get_previous_reports
+from btb_manager_telegram.price_oracle import price_oracle
+from btb_manager_telegram.report_history import report_history
+from btb_manager_telegram.scout_cache import scout_cache
 from btb_manager_telegram.table import float_strip, tabularize
+from btb_manager_telegram.trade_stats import parse_date, trade_stats
 from btb_manager_telegram.utils import (
     find_and_kill_binance_trade_bot_process,
     get_binance_trade_bot_process,
@@ -23,6 +29,19 @@ from btb_manager_telegram.utils import (
     setup_coin_list,
 )
 
+# current coin, bridge, order state, order size and initial buying price
+CURRENT_TRADE_QUERY = """SELECT alt_coin_id, crypto_coin_id, state, alt_trade_amount, crypto_starting_balance, crypto_trade_amount
+FROM trade_history
+WHERE state != 'STARTING'
+ORDER BY datetime DESC
+LIMIT 1"""
+# balance, price in USD and in BTC of a coin
+COIN_VALUE_QUERY = """SELECT balance, usd_price, btc_price, datetime
+FROM coin_value
+WHERE coin_id = ?
+ORDER BY datetime DESC
+LIMIT 1"""
+
 
 @get_db_cursor
 @if_exception_log("Cannot retreive current value data.", raise_error=True)
@@ -30,15 +49,7 @@ def current_value(cur):
     logger.info("Current value button pressed.")
 
     # Get current coin symbol, bridge symbol, order state, order size, initial buying price
-    cur.execute(
-        """
-        SELECT alt_coin_id, crypto_coin_id, state, alt_trade_amount, crypto_starting_balance, crypto_trade_amount 
-        FROM trade_history 
-        WHERE state!='STARTING' 
-        ORDER BY datetime DESC 
-        LIMIT 1;
-        """
-    )
+    cur.execute(CURRENT_TRADE_QUERY)
     (
         current_coin,
         bridge,
@@ -56,12 +67,7 @@ def current_value(cur):
         ]
 
     # Get balance, current coin price in USD, current coin price in BTC
-    cur.execute(
-        f"""SELECT balance, usd_price, btc_price, datetime
-            FROM 'coin_value'
-            WHERE coin_id = '{current_coin}'
-            ORDER BY datetime DESC LIMIT 1;"""
-    )
+    cur.execute(COIN_VALUE_QUERY, (current_coin,))
     query = cur.fetchone()
     if query is None:
         return [
@@ -78,33 +84,36 @@ def current_value(cur):
         btc_price = 0
     last_update = dt.datetime.strptime(last_update, "%Y-%m-%d %H:%M:%S.%f")
 
-    reports = get_previous_reports()
-    reports.reverse()
-
     days_deltas = [1, 7, 30]
-    return_rates = []
+    return_rates = ["N/A"] * len(days_deltas)
     amount_btc_now = balance * btc_price
     ts_now = int(last_update.timestamp())
-    delta = days_deltas[0]
-    for report in reports:
-        if ts_now - report["time"] > dt.timedelta(days=delta).total_seconds():
-            if (
-                ts_now - report["time"] - dt.timedelta(days=delta).total_seconds()
-                < dt.timedelta(hours=2).total_seconds()
-                and report["total_usdt"] > 0
-            ):
-                amount_btc_old = report["total_usdt"] / report["tickers"]["BTC"]
-                rate = (amount_btc_now - amount_btc_old) / amount_btc_old
-                rate_str = "+" if rate >= 0 else ""
-                rate_str += str(round(rate * 100, 2))
-                rate_str += " %"
-            else:
-                rate_str = "N/A"
-            return_rates.append(rate_str)
-            if len(return_rates) == len(days_deltas):
-                break
-            delta = days_deltas[len(return_rates)]
-    return_rates += ["N/A"] * (len(days_deltas) - len(return_rates))
+    reports = report_history.window()
+    if len(reports.times) > 0 and "BTC" in reports.symbols:
+        ts_deltas = (
+            ts_now - np.array(days_deltas) * dt.timedelta(days=1).total_seconds()
+        )
+        # most recent report older than each delta
+        indices = np.searchsorted(reports.times, ts_deltas, "left") - 1
+        found = indices >= 0
+        indices = np.maximum(indices, 0)
+        total_usdt_old = reports.total_usdt[indices]
+        amounts_btc_old = (
+            total_usdt_old / reports.prices[indices, reports.symbols["BTC"]]
+        )
+        # older reports may be rollups covering a longer period
+        max_gaps = np.maximum(
+            reports.periods[indices], dt.timedelta(hours=2).total_seconds()
+        )
+        found &= ts_deltas - reports.times[indices] < max_gaps
+        found &= total_usdt_old > 0
+        rates = (amount_btc_now - amounts_btc_old) / amounts_btc_old
+        for i_delta in np.flatnonzero(found):
+            rate = rates[i_delta]
+            rate_str = "+" if rate >= 0 else ""
+            rate_str += str(round(rate * 100, 2))
+            rate_str += " %"
+            return_rates[i_delta] = rate_str
 
     m_list = [
         f"\n{i18n.t('value.last_update', update=last_update.strftime('%H:%M:%S %d/%m/%Y'))}\n\n",
@@ -134,83 +143,80 @@ def current_value(cur):
     return message
 
 
+def format_progress(progress):
+    """
+    Text of a complete buy, as shown by the progress button
+    """
+    last_trade_date = dt.datetime.strptime(progress.datetime, "%Y-%m-%d %H:%M:%S.%f")
+    if progress.pre_last_trade_date is None:
+        pre_last_trade_date = last_trade_date
+    else:
+        pre_last_trade_date = dt.datetime.strptime(
+            progress.pre_last_trade_date, "%Y-%m-%d %H:%M:%S.%f"
+        )
+
+    time_passed = last_trade_date - pre_last_trade_date
+    last_trade_date = last_trade_date.strftime("%H:%M:%S %d/%m/%Y")
+    change = (
+        i18n.t(
+            "progress.change_over_days",
+            amount=progress.change,
+            coin=progress.coin,
+            percent=round(
+                progress.change / (progress.amount - progress.change) * 100, 2
+            ),
+            days=time_passed.days,
+            hours=time_passed.seconds // 3600,
+        )
+        if progress.change is not None
+        else progress.change
+    )
+    return (
+        f"*{progress.coin}*\n"
+        f"\t{i18n.t('progress.amount', amount=progress.amount, coin=progress.coin)}\n"
+        f"\t{i18n.t('progress.price', amount=round(progress.price, 2))}\n"
+        f"\t{change}\n"
+        f"\t{i18n.t('progress.trade_datetime', date=last_trade_date)}\n\n"
+    )
+
+
+def format_trade(trade):
+    """
+    Text of a trade, as shown by the trade history button
+    """
+    date = dt.datetime.strptime(trade.datetime, "%Y-%m-%d %H:%M:%S.%f")
+    if trade.crypto_trade_amount is not None:
+        trade_details = i18n.t(
+            "history.sold_bought",
+            sold_trade=i18n.t("history.sold")
+            if trade.selling
+            else i18n.t("history.bought"),
+            amount1=trade.alt_trade_amount,
+            coin1=trade.alt_coin_id,
+            amount2=trade.crypto_trade_amount,
+            coin2=trade.crypto_coin_id,
+        )
+    else:
+        trade_details = ""
+
+    return (
+        f"`{date.strftime('%H:%M:%S %d/%m/%Y')}`\n"
+        f"{trade_details}\n"
+        f"{i18n.t('history.status', status=trade.state)}\n\n"
+    )
+
+
 @get_db_cursor
+@cached_until_changed("trade_history")
 @if_exception_log("Cannot retreive progress data.")
 def check_progress(cur):
     logger.info("Progress button pressed.")
 
-    cur.execute(
-        """
-SELECT *
-FROM (
-    SELECT 
-        th1.alt_coin_id AS coin, 
-        th1.alt_trade_amount AS amount, 
-        th1.crypto_trade_amount AS priceInUSD,
-        (
-            th1.alt_trade_amount - ( 
-                SELECT th2.alt_trade_amount 
-                FROM trade_history th2
-                WHERE 
-                    th2.state = 'COMPLETE' 
-                    AND th2.alt_coin_id = th1.alt_coin_id 
-                    AND th1.datetime > th2.datetime 
-                    AND th2.selling = 0 
-                    ORDER BY th2.datetime DESC LIMIT 1
-            )
-        ) AS change, 
-        (
-            SELECT th2.datetime 
-            FROM trade_history th2 
-            WHERE 
-                th2.state = 'COMPLETE' 
-                AND th2.alt_coin_id = th1.alt_coin_id 
-                AND th1.datetime > th2.datetime 
-                AND th2.selling = 0 
-                ORDER BY th2.datetime DESC LIMIT 1
-        ) AS pre_last_trade_date, 
-        datetime 
-    FROM trade_history th1 
-    WHERE 
-        th1.state = 'COMPLETE' 
-        AND th1.selling = 0 
-    ORDER BY th1.datetime DESC LIMIT 15
-)
-ORDER BY datetime ASC
-    """
-    )
-    query = cur.fetchall()
+    query = trade_stats.refresh(cur).get_progress()
 
     # Generate message
     m_list = [f"{i18n.t('progress.coin')}\n\n"]
-    for coin in query:
-        last_trade_date = dt.datetime.strptime(coin[5], "%Y-%m-%d %H:%M:%S.%f")
-        if coin[4] is None:
-            pre_last_trade_date = dt.datetime.strptime(coin[5], "%Y-%m-%d %H:%M:%S.%f")
-        else:
-            pre_last_trade_date = dt.datetime.strptime(coin[4], "%Y-%m-%d %H:%M:%S.%f")
-
-        time_passed = last_trade_date - pre_last_trade_date
-        last_trade_date = last_trade_date.strftime("%H:%M:%S %d/%m/%Y")
-        change = (
-            i18n.t(
-                "progress.change_over_days",
-                amount=coin[3],
-                coin=coin[0],
-                percent=round(coin[3] / (coin[1] - coin[3]) * 100, 2),
-                days=time_passed.days,
-                hours=time_passed.seconds // 3600,
-            )
-            if coin[3] is not None
-            else coin[3]
-        )
-        m_list.append(
-            f"*{coin[0]}*\n"
-            f"\t{i18n.t('progress.amount', amount=coin[1], coin=coin[0])}\n"
-            f"\t{i18n.t('progress.price', amount=round(coin[2], 2))}\n"
-            f"\t{change}\n"
-            f"\t{i18n.t('progress.trade_datetime', date=last_trade_date)}\n\n"
-        )
+    m_list.extend(format_progress(coin) for coin in query)
 
     message = telegram_text_truncator(m_list)
     return message
@@ -244,35 +250,27 @@ def next_coin(cur, config):
     from_fee = 0.001
     to_fee = 0.001
     transaction_fee = from_fee + to_fee - from_fee * to_fee
-    if use_margin:  # scout_margin
-        target_price_calculation = f"(1-{transaction_fee}) * sh.current_coin_price / (sh.target_ratio *(1+{scout_margin}))"
-    else:  # default
-        target_price_calculation = f"(current_coin_price - 0.001 * '{scout_multiplier}' * current_coin_price) / sh.target_ratio"
-
-    cur.execute(
-        f"""
-SELECT
-    coin,
-    current_price,
-    target_price,
-    target_price / current_price * 100 AS percentage
-FROM (
-    SELECT 
-        p.to_coin_id AS coin, 
-        sh.other_coin_price AS current_price, 
-        {target_price_calculation} AS target_price,
-    MAX(sh.datetime)
-    FROM scout_history sh 
-    JOIN pairs p ON p.id = sh.pair_id 
-    WHERE p.from_coin_id = (
-        SELECT alt_coin_id FROM trade_history ORDER BY datetime DESC LIMIT 1
-    )
-    GROUP BY coin
-)
-ORDER BY percentage DESC;
-    """
-    )
-    query = cur.fetchall()
+    recent_trades = trade_stats.refresh(cur).get_recent_trades()
+    current_coin = recent_trades[0].alt_coin_id if len(recent_trades) > 0 else None
+
+    query = []
+    for coin, scout in scout_cache.refresh(cur).get_latest(current_coin).items():
+        if use_margin:  # scout_margin
+            target_price = (
+                (1 - transaction_fee)
+                * scout.current_coin_price
+                / (scout.target_ratio * (1 + scout_margin))
+            )
+        else:  # default
+            target_price = (
+                scout.current_coin_price
+                - 0.001 * scout_multiplier * scout.current_coin_price
+            ) / scout.target_ratio
+        current_price = scout.other_coin_price
+        query.append(
+            [coin, current_price, target_price, target_price / current_price * 100]
+        )
+    query.sort(key=lambda q: q[3], reverse=True)
     m_list = []
 
     m_list.extend(
@@ -304,43 +302,20 @@ def check_status():
 
 
 @get_db_cursor
+@cached_until_changed("trade_history")
 @if_exception_log("Cannot retreive trade history data.")
 def trade_history(cur):
     logger.info("Trade history button pressed.")
 
     # Get last 10 trades
-    cur.execute(
-        """SELECT alt_coin_id, crypto_coin_id, selling, state, alt_trade_amount, crypto_trade_amount, datetime FROM trade_history ORDER BY datetime DESC LIMIT 10;"""
-    )
-    query = cur.fetchall()
+    query = trade_stats.refresh(cur).get_recent_trades()
 
     m_list = [
         f"{i18n.t('history.last_x_trades', trades=10 if len(query) > 10 else len(query))}\n\n"
     ]
-    for trade in query:
-        if trade[4] is None:
-            continue
-        date = dt.datetime.strptime(trade[6], "%Y-%m-%d %H:%M:%S.%f")
-        if trade[5] is not None:
-
-            trade_details = i18n.t(
-                "history.sold_bought",
-                sold_trade=i18n.t("history.sold")
-                if trade[2]
-                else i18n.t("history.bought"),
-                amount1=trade[4],
-                coin1=trade[0],
-                amount2=trade[5],
-                coin2=trade[1],
-            )
-        else:
-            trade_details = ""
-
-        m_list.append(
-            f"`{date.strftime('%H:%M:%S %d/%m/%Y')}`\n"
-            f"{trade_details}\n"
-            f"{i18n.t('history.status', status=trade[3])}\n\n"
-        )
+    m_list.extend(
+        format_trade(trade) for trade in query if trade.alt_trade_amount is not None
+    )
 
     message = telegram_text_truncator(m_list)
     return message
@@ -352,14 +327,11 @@ def bot_stats(cur):
     message = ""
     stableCoins = ["USDT", "USD", "BUSD", "USDC", "DAI"]
 
-    cur.execute(
-        "SELECT datetime FROM trade_history WHERE selling=0 and state='COMPLETE' ORDER BY id ASC LIMIT 1"
-    )
-    query = cur.fetchall()
-    if len(query) == 0:
+    summary = trade_stats.refresh(cur).get_summary()
+    if summary.first_buy is None:
         message = [i18n.t("bot_stats.error.date_error")]
         return message
-    bot_start_date = query[0][0]
+    bot_start_date = summary.first_buy.datetime
 
     cur.execute("SELECT datetime FROM scout_history ORDER BY id DESC LIMIT 1")
     query = cur.fetchall()
@@ -368,63 +340,46 @@ def bot_stats(cur):
         return message
     bot_end_date = query[0][0]
 
-    cur.execute("SELECT * FROM trade_history ")
-    lenTradeHistory = len(cur.fetchall())
+    lenTradeHistory, numCoinJumps = summary.nb_trades, summary.nb_buys
     if not lenTradeHistory > 0:
         message = [i18n.t("bot_stats.error.empty_trade_history")]
         return message
 
-    cur.execute("SELECT count(*) FROM trade_history WHERE selling=0")
-    numCoinJumps = cur.fetchall()[0][0]
-
     start_date = dt.datetime.strptime(bot_start_date[2:], "%y-%m-%d %H:%M:%S.%f")
     end_date = dt.datetime.strptime(bot_end_date[2:], "%y-%m-%d %H:%M:%S.%f")
     numDays = (end_date - start_date).days
 
-    reports = [r for r in get_previous_reports() if r["time"] >= start_date.timestamp()]
+    reports = report_history.window(start=start_date.timestamp())
 
     # get first trade and its bridge - all stats must be in this bridge
-    cur.execute(
-        f"""SELECT alt_coin_id, crypto_coin_id, alt_trade_amount, crypto_trade_amount
-        FROM 'trade_history' WHERE state='COMPLETE' ORDER BY id ASC LIMIT 1;"""
-    )
-    query = cur.fetchone()
+    query = summary.first_trade
     if query is None:
         logger.error(i18n.t("bot_stats.error.first_coin_error"))
         message = [i18n.t("bot_stats.error.first_coin_error")]
         return message
-    (
-        initialCoinID,
-        initialCoinbridgeID,
-        initialCoinAmount,
-        initialCoinFiatValue,
-    ) = query
-
-    cur.execute(
-        f"""SELECT alt_coin_id, alt_trade_amount
-        FROM 'trade_history'
-        WHERE selling=0 and state='COMPLETE'
-        ORDER BY id DESC LIMIT 1;"""
-    )
-    query = cur.fetchone()
+    initialCoinID = query.alt_coin_id
+    initialCoinbridgeID = query.crypto_coin_id
+    initialCoinAmount = query.alt_trade_amount
+    initialCoinFiatValue = query.crypto_trade_amount
+
+    query = summary.last_buy
     if query is None:
         logger.error(i18n.t("bot_stats.error.current_coin_error"))
         message = [i18n.t("bot_stats.error.current_coin_error")]
         return message
-    currentCoinID, currentCoinAmount = query
+    currentCoinID, currentCoinAmount = query.alt_coin_id, query.alt_trade_amount
 
     displayCurrency = "$" if initialCoinbridgeID in stableCoins else initialCoinbridgeID
 
-    if initialCoinbridgeID in stableCoins:
-        initialCoinLiveBridgePrice = get_current_price(initialCoinID, "USDT")
-        currentCoinLiveBridgePrice = get_current_price(currentCoinID, "USDT")
-    else:
-        initialCoinLiveBridgePrice = get_current_price(
-            initialCoinID, "USDT"
-        ) / get_current_price(initialCoinbridgeID, "USDT")
-        currentCoinLiveBridgePrice = get_current_price(
-            currentCoinID, "USDT"
-        ) / get_current_price(initialCoinbridgeID, "USDT")
+    pairs = [f"{initialCoinID}USDT", f"{currentCoinID}USDT"]
+    if initialCoinbridgeID not in stableCoins:
+        pairs.append(f"{initialCoinbridgeID}USDT")
+    prices = price_oracle.get_prices(pairs)
+    initialCoinLiveBridgePrice = prices[f"{initialCoinID}USDT"]
+    currentCoinLiveBridgePrice = prices[f"{currentCoinID}USDT"]
+    if initialCoinbridgeID not in stableCoins:
+        initialCoinLiveBridgePrice /= prices[f"{initialCoinbridgeID}USDT"]
+        currentCoinLiveBridgePrice /= prices[f"{initialCoinbridgeID}USDT"]
 
     initialCoinLiveBridgeValue = (
         initialCoinAmount * initialCoinLiveBridgePrice
@@ -443,11 +398,11 @@ def bot_stats(cur):
         (convertibleStartCoinAmount - initialCoinAmount) / initialCoinAmount * 100
     )
 
-    max_usd = max(reports, key=lambda a: a["total_usdt"])["total_usdt"]
-    min_usd = min(reports, key=lambda a: a["total_usdt"])["total_usdt"]
-    btc_vals = [a["total_usdt"] / a["tickers"]["BTC"] for a in reports]
-    max_btc = max(btc_vals)
-    min_btc = min(btc_vals)
+    max_usd = np.max(reports.usdt_max)
+    min_usd = np.min(reports.usdt_min)
+    btc_vals = reports.total_usdt / reports.prices[:, reports.symbols["BTC"]]
+    max_btc = np.nanmax(btc_vals)
+    min_btc = np.nanmin(btc_vals)
 
     message += (
         "`"
@@ -462,33 +417,20 @@ def bot_stats(cur):
         "`"
     )
 
+    coin_stats = trade_stats.get_coins()
+
     rows = []
     for coin in settings.COIN_LIST:
-        cur.execute(
-            f"SELECT COUNT(*) FROM trade_history WHERE alt_coin_id='{coin}' and selling=0 and state='COMPLETE'"
-        )
-        query = cur.fetchall()
-        if len(query) == 0:
-            continue
-        jumps = query[0][0]
-
-        cur.execute(
-            f"SELECT datetime, alt_trade_amount FROM trade_history WHERE alt_coin_id='{coin}' and state='COMPLETE' ORDER BY id ASC LIMIT 1"
-        )
-        query = cur.fetchall()
-        if len(query) == 0:
+        if coin not in coin_stats or coin_stats[coin].last_buy is None:
             continue
-        first_date, first_value = query[0]
+        jumps = coin_stats[coin].jumps
+        first_value = coin_stats[coin].first_amount
+        last_value = coin_stats[coin].last_amount
+        grow = coin_stats[coin].growth
+        held = coin_stats[coin].hold_time
+        if coin == currentCoinID:
+            held += end_date - parse_date(summary.last_buy.datetime)
 
-        cur.execute(
-            f"SELECT alt_trade_amount FROM trade_history WHERE alt_coin_id='{coin}' and selling=0 and state='COMPLETE' ORDER BY id DESC LIMIT 1"
-        )
-        query = cur.fetchall()
-        if len(query) == 0:
-            continue
-        last_value = query[0][0]
-
-        grow = (last_value - first_value) / first_value * 100
         rows.append(
             [
                 coin,
@@ -496,6 +438,7 @@ def bot_stats(cur):
                 float(last_value),
                 str(round(grow, 2)) if grow != 0 else "0",
                 str(jumps),
+                f"{max(held.total_seconds(), 0) / 86400:.1f}d",
             ]
         )
 
@@ -511,11 +454,12 @@ def bot_stats(cur):
                 i18n.t("bot_stats.table.to"),
                 "% ±",
                 "<->",
+                i18n.t("bot_stats.table.held"),
             ],
             rows,
-            [4, 8, 8, 8, 3],
+            [4, 8, 8, 8, 3, 6],
             add_spaces=False,
-            align=["left", "right", "right", "right", "right"],
+            align=["left", "right", "right", "right", "right", "right"],
         )
         message += f"\n\n*{i18n.t('bot_stats.coin_progress')}*\n"
         message = [message]
@@ -592,6 +536,26 @@ def delete_db():
     return [message, delete]
 
 
+def prune_scouts():
+    logger.info("Prune scout history button pressed.")
+
+    message = i18n.t("db.prune.stop_bot")
+    prune = False
+    db_file_path = os.path.join(settings.ROOT_PATH, "data/crypto_trading.db")
+    if not get_binance_trade_bot_process():
+        if os.path.exists(db_file_path):
+            message = i18n.t(
+                "db.prune.sure_hourly"
+                if settings.SCOUT_KEEP_HOURLY
+                else "db.prune.sure",
+                days=settings.SCOUT_RETENTION_DAYS,
+            )
+            prune = True
+        else:
+            message = f"{i18n.t('database_not_found', path=db_file_path)}"
+    return [message, prune]
+
+
 def edit_user_cfg():
     logger.info("Edit user configuration button pressed.")
 
@@ -639,17 +603,19 @@ def edit_coin():
 def export_db():
     logger.info("Export database button pressed.")
 
-    message = i18n.t("db.export.stop_bot")
-    db_file_path = os.path.join(settings.ROOT_PATH, "data/crypto_trading.db")
-    file = None
-    if not get_binance_trade_bot_process():
-        if os.path.exists(db_file_path):
-            with open(db_file_path, "rb") as db:
-                file = db.read()
+    message = i18n.t("db.export.error")
+    parts = None
+    export_dir = tempfile.mkdtemp(prefix="btbmt_export_")
+    try:
+        parts = db_tools.export_db(export_dir)
+        if len(parts) == 1:
             message = i18n.t("db.export.file")
         else:
-            message = i18n.t("db.export.error")
-    return [message, file]
+            message = i18n.t("db.export.parts", nb=len(parts))
+    except Exception as e:
+        logger.error(f"❌ Unable to export the database: {e}", exc_info=True)
+        shutil.rmtree(export_dir, ignore_errors=True)
+    return [message, parts]
 
 
 def update_tg_bot():
@@ -714,7 +680,7 @@ def panic_btn():
 
             if not selling:
                 price_old = crypto_trade_amount / alt_trade_amount
-                price_now = get_current_price(alt_coin_id, crypto_coin_id)
+                price_now = price_oracle.get_price(alt_coin_id, crypto_coin_id)
                 if state == "COMPLETE":
                     con.close()
                     return [
@@ -753,7 +719,7 @@ def panic_btn():
                     ]
                 else:
                     price_old = crypto_trade_amount / alt_trade_amount
-                    price_now = get_current_price(alt_coin_id, crypto_coin_id)
+                    price_now = price_oracle.get_price(alt_coin_id, crypto_coin_id)
                     con.close()
                     return [
                         f"{i18n.t('panic.open_sell_order', amount1=alt_trade_amount, coin1=alt_coin_id, amount2=crypto_trade_amount, coin2=crypto_coin_id)}\n\n"
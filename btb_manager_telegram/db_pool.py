@@ -0,0 +1,333 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+import urllib.parse
+
+from btb_manager_telegram import settings
+from btb_manager_telegram.logging import logger
+
+POOL_SIZE = 4
+CACHE_SIZE_KIB = 8192
+MMAP_SIZE = 64 * 1024 * 1024
+BUSY_TIMEOUT_MS = 5000
+SLOW_QUERY_S = 0.1
+# the database is copied at most once per this many seconds
+REPLICA_MIN_COPY_INTERVAL_S = 60
+NB_LOGGED_QUERIES = 5
+
+
+def trade_db_path():
+    return os.path.join(settings.ROOT_PATH, "data/crypto_trading.db")
+
+
+def replica_db_path():
+    return os.path.join(settings.ROOT_PATH, "data", "btbmt_replica.db")
+
+
+class _BackupRestarted(Exception):
+    pass
+
+
+def backup_db(src_path, dst_path, pages=1024, max_restarts=10):
+    """
+    Copies the database with SQLite's online backup API, `pages` pages
+    at a time, so that the trade bot can keep writing during the copy.
+    The copy starts over each time the database is modified between two
+    steps. After `max_restarts` restarts it is finished in a single step,
+    which holds a read lock on the database for the time of the copy.
+    """
+    restarts = 0
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal restarts, last_remaining
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > max_restarts:
+                raise _BackupRestarted()
+        last_remaining = remaining
+
+    src = sqlite3.connect(src_path)
+    dst = sqlite3.connect(dst_path)
+    try:
+        try:
+            src.backup(dst, pages=pages, progress=progress)
+        except _BackupRestarted:
+            logger.info(
+                "The database changed too often during the backup, copying it at once"
+            )
+            src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
+class QueryStats:
+    def __init__(self):
+        """
+        Number of executions, total and max duration of each query
+        run through the pool, fetching the rows included
+        """
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def record(self, query, duration):
+        with self.lock:
+            count, total, longest = self.stats.get(query, (0, 0, 0))
+            self.stats[query] = (count + 1, total + duration, max(longest, duration))
+        if duration > SLOW_QUERY_S:
+            logger.debug(f"Slow query ({duration:.3f}s): {' '.join(query.split())}")
+
+    def get(self):
+        """
+        Returns a list of (query, count, total, max) sorted by total duration
+        """
+        with self.lock:
+            stats = [(query, *values) for query, values in self.stats.items()]
+        return sorted(stats, key=lambda s: s[2], reverse=True)
+
+    def log_stats(self, nb_queries=NB_LOGGED_QUERIES):
+        """
+        Logs the queries which took the most time in total
+        """
+        stats = self.get()[:nb_queries]
+        if len(stats) == 0:
+            return
+        lines = [
+            f"{count} runs, {total:.3f}s total, {longest:.3f}s max: {' '.join(query.split())}"
+            for query, count, total, longest in stats
+        ]
+        logger.debug("Slowest queries:\n" + "\n".join(lines))
+
+
+query_stats = QueryStats()
+
+
+class TimedCursor(sqlite3.Cursor):
+    """
+    Cursor recording the time spent executing each query and fetching its rows
+    """
+
+    def _timed(self, fun, *args):
+        start = time.perf_counter()
+        try:
+            return fun(*args)
+        finally:
+            self._duration += time.perf_counter() - start
+
+    def _flush(self):
+        if getattr(self, "_query", None) is not None:
+            query_stats.record(self._query, self._duration)
+        self._query = None
+
+    def execute(self, query, params=()):
+        self._flush()
+        self._query, self._duration = query, 0
+        self._timed(super().execute, query, params)
+        return self
+
+    def fetchone(self):
+        return self._timed(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed(super().fetchmany, size or self.arraysize)
+
+    def fetchall(self):
+        return self._timed(super().fetchall)
+
+    def close(self):
+        self._flush()
+        super().close()
+
+
+class PooledConnection(sqlite3.Connection):
+    file_id = None
+    source_id = None
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+
+class ReadConnectionPool:
+    def __init__(self, size=POOL_SIZE):
+        """
+        Pool of read-only connections to the database of the trade bot.
+        Keeping the connections open keeps SQLite's page cache and
+        prepared statements between two button presses. The connections
+        are dropped when the database file is replaced (for instance
+        after it has been deleted), which is detected from its inode.
+        """
+        self.size = size
+        self.lock = threading.Lock()
+        self.idle = queue.LifoQueue()
+        self.file_id = None
+
+    def _open(self, path, file_id):
+        uri = f"file:{urllib.parse.quote(path)}?mode=ro"
+        con = sqlite3.connect(
+            uri,
+            uri=True,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            factory=PooledConnection,
+        )
+        con.file_id = file_id
+        con.execute("PRAGMA query_only=ON")
+        con.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+        con.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        con.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        return con
+
+    def _drain(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def acquire(self):
+        """
+        Returns an open connection, raises FileNotFoundError
+        if the database does not exist
+        """
+        replica = db_replica.get()
+        path, source_id = replica if replica is not None else (trade_db_path(), None)
+        stat = os.stat(path)
+        file_id = (path, stat.st_dev, stat.st_ino)
+        with self.lock:
+            if file_id != self.file_id:
+                if self.file_id is not None and replica is None:
+                    logger.info("The database file changed, reopening the connections")
+                self._drain()
+                self.file_id = file_id
+        try:
+            con = self.idle.get_nowait()
+            if con.file_id == file_id:
+                return con
+            con.close()
+        except queue.Empty:
+            pass
+        con = self._open(path, file_id)
+        # identifies the trade bot database, the replica being replaced at each copy
+        con.source_id = file_id if source_id is None else source_id
+        return con
+
+    def release(self, con):
+        with self.lock:
+            if con.file_id == self.file_id and self.idle.qsize() < self.size:
+                self.idle.put(con)
+                return
+        con.close()
+
+    def close(self):
+        with self.lock:
+            self._drain()
+            self.file_id = None
+
+
+class DbReplica:
+    def __init__(self):
+        """
+        Local copy of the trade bot database, used by the pool instead of
+        the live database when `settings.DB_REPLICA_INTERVAL` is set, so
+        that the queries of the manager never hold a lock the trade bot
+        waits for. The copy is only refreshed when `PRAGMA data_version`
+        shows that the trade bot committed something since the last one.
+        The copy is made by its own thread, at most once per
+        `REPLICA_MIN_COPY_INTERVAL_S` seconds.
+        """
+        self.lock = threading.Lock()
+        self.con = None
+        self.source_id = None
+        self.data_version = None
+        self.copy_thread = None
+        self.last_copy = None
+
+    def _close(self):
+        if self.con is not None:
+            self.con.close()
+            self.con = None
+        self.data_version = None
+
+    def refresh(self):
+        """
+        Starts copying the trade bot database to the replica if it changed.
+        Returns True if a copy was started.
+        """
+        if self.copy_thread is not None and self.copy_thread.is_alive():
+            return False
+        if (
+            self.last_copy is not None
+            and time.monotonic() - self.last_copy < REPLICA_MIN_COPY_INTERVAL_S
+        ):
+            return False
+
+        path = trade_db_path()
+        replica_path = replica_db_path()
+        if not os.path.isfile(path):
+            with self.lock:
+                self._close()
+                self.source_id = None
+            if os.path.isfile(replica_path):
+                os.remove(replica_path)
+            return False
+
+        stat = os.stat(path)
+        source_id = (path, stat.st_dev, stat.st_ino)
+        if source_id != self.source_id:
+            self._close()
+        if self.con is None:
+            self.con = sqlite3.connect(
+                f"file:{urllib.parse.quote(path)}?mode=ro",
+                uri=True,
+                check_same_thread=False,
+            )
+        data_version = self.con.execute("PRAGMA data_version").fetchone()[0]
+        if (
+            source_id == self.source_id
+            and data_version == self.data_version
+            and os.path.isfile(replica_path)
+        ):
+            return False
+
+        self.last_copy = time.monotonic()
+        self.copy_thread = threading.Thread(
+            target=self._copy,
+            args=(path, replica_path, source_id, data_version),
+            daemon=True,
+        )
+        self.copy_thread.start()
+        return True
+
+    def _copy(self, path, replica_path, source_id, data_version):
+        start = time.perf_counter()
+        try:
+            backup_db(path, f"{replica_path}.tmp")
+            os.replace(f"{replica_path}.tmp", replica_path)
+        except Exception as e:
+            logger.error(f"Unable to refresh the database replica: {e}")
+            return
+        with self.lock:
+            self.source_id = source_id
+            self.data_version = data_version
+        logger.debug(
+            f"Database replica refreshed in {time.perf_counter() - start:.2f}s"
+        )
+
+    def get(self):
+        """
+        Returns the path of the replica and the identity of the database
+        it copies, or None if the replica is disabled or not ready
+        """
+        if settings.DB_REPLICA_INTERVAL <= 0:
+            return None
+        with self.lock:
+            if self.source_id is None or not os.path.isfile(replica_db_path()):
+                return None
+            return replica_db_path(), self.source_id
+
+
+db_replica = DbReplica()
+read_pool = ReadConnectionPool()
@@ -0,0 +1,452 @@
+import argparse
+import datetime as dt
+import gzip
+import os
+import shutil
+import sqlite3
+
+from btb_manager_telegram import settings
+from btb_manager_telegram.db_pool import backup_db, read_pool, trade_db_path
+from btb_manager_telegram.db_watcher import TABLE_SIGNATURES
+from btb_manager_telegram.formating import format_size
+from btb_manager_telegram.scout_cache import LATEST_SCOUTS_QUERY, scout_cache
+from btb_manager_telegram.trade_stats import NEW_TRADES_QUERY
+from btb_manager_telegram.utils import get_binance_trade_bot_process
+
+# indexes which may speed up the lookups made by the manager, only the ones
+# improving the query plans on the actual schema are advised
+CANDIDATE_INDEXES = [
+    ("btbmt_trade_history_datetime", "trade_history", ["datetime"]),
+    ("btbmt_coin_value_coin", "coin_value", ["coin_id", "datetime"]),
+    ("btbmt_scout_history_pair", "scout_history", ["pair_id", "datetime"]),
+]
+
+
+PRUNE_BATCH_SIZE = 10000
+VACUUM_STEP_PAGES = 2000
+HOUR_FORMAT = "%Y-%m-%d %H"
+# telegram bots cannot upload files larger than 50 MB
+EXPORT_PART_SIZE = 49 * 1000 * 1000
+EXPORT_CHUNK_SIZE = 1024 * 1024
+
+
+class BotRunningError(Exception):
+    pass
+
+
+def db_size(path):
+    """
+    Size of the database with its write-ahead log
+    """
+    return sum(os.path.getsize(f) for f in (path, f"{path}-wal") if os.path.isfile(f))
+
+
+class SplitWriter:
+    def __init__(self, path, part_size):
+        """
+        Binary file-like object writing to `path.001`, `path.002`...
+        with at most `part_size` bytes per file
+        """
+        self.path = path
+        self.part_size = part_size
+        self.paths = []
+        self.file = None
+        self.written = 0
+
+    def write(self, data):
+        data = memoryview(data)
+        size = len(data)
+        while len(data) > 0:
+            if self.file is None or self.written >= self.part_size:
+                self._next_part()
+            chunk = data[: self.part_size - self.written]
+            self.file.write(chunk)
+            self.written += len(chunk)
+            data = data[len(chunk) :]
+        return size
+
+    def _next_part(self):
+        if self.file is not None:
+            self.file.close()
+        self.paths.append(f"{self.path}.{len(self.paths) + 1:03d}")
+        self.file = open(self.paths[-1], "wb")
+        self.written = 0
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self):
+        """
+        Returns the paths of the parts. A single part is named `path`.
+        """
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if len(self.paths) == 1:
+            os.replace(self.paths[0], self.path)
+            self.paths = [self.path]
+        return self.paths
+
+
+def export_db(dest_dir, part_size=EXPORT_PART_SIZE):
+    """
+    Exports a gzip compressed copy of the trade bot database to `dest_dir`,
+    split in parts of at most `part_size` bytes. The database is copied
+    with the online backup API, so the trade bot does not need to be
+    stopped, and is compressed by chunks, so the memory use does not
+    depend on its size. Returns the paths of the parts.
+    """
+    path = trade_db_path()
+    if not os.path.isfile(path):
+        raise FileNotFoundError(path)
+    copy_path = os.path.join(dest_dir, "crypto_trading.db")
+    backup_db(path, copy_path)
+
+    writer = SplitWriter(f"{copy_path}.gz", part_size)
+    try:
+        with open(copy_path, "rb") as src, gzip.GzipFile(
+            filename="crypto_trading.db", mode="wb", fileobj=writer
+        ) as dst:
+            shutil.copyfileobj(src, dst, EXPORT_CHUNK_SIZE)
+    finally:
+        paths = writer.close()
+        os.remove(copy_path)
+    return paths
+
+
+def advised_queries():
+    """
+    Returns the lookups made by the manager on the trade bot
+    database, as a list of (name, query, params)
+    """
+    # imported here, as the buttons use this module
+    from btb_manager_telegram.buttons import COIN_VALUE_QUERY, CURRENT_TRADE_QUERY
+
+    return [
+        ("New trades", NEW_TRADES_QUERY.format("?"), (0, 0)),
+        ("Latest scouts", LATEST_SCOUTS_QUERY, (0,)),
+        ("Current trade", CURRENT_TRADE_QUERY, ()),
+        ("Current coin value", COIN_VALUE_QUERY, ("BTC",)),
+    ] + [
+        (f"Last change of {table}", query, ())
+        for table, query in TABLE_SIGNATURES.items()
+    ]
+
+
+def explain(con, query, params=()):
+    """
+    Returns the steps of the query plan as a list of strings,
+    or None if the query cannot run on this database
+    """
+    try:
+        return [row[-1] for row in con.execute(f"EXPLAIN QUERY PLAN {query}", params)]
+    except sqlite3.OperationalError:
+        return None
+
+
+def plan_cost(plan):
+    """
+    Number of full scans, then of temporary b-trees of a query plan
+    """
+    if plan is None:
+        return (0, 0)
+    return (
+        sum(step.startswith("SCAN") for step in plan),
+        sum("TEMP B-TREE" in step for step in plan),
+    )
+
+
+def review_indexes(con, queries):
+    """
+    Compares the query plans with and without each index on an empty
+    copy of the schema. Returns the candidate indexes which make at least
+    one query cheaper and none more expensive, and the names of the indexes
+    created by the manager which do not make any query cheaper.
+    """
+    # the cached plans would not change with the indexes
+    schema = sqlite3.connect(":memory:", cached_statements=0)
+    try:
+        for (sql,) in con.execute(
+            "SELECT sql FROM sqlite_master WHERE type IN ('table', 'index') AND sql IS NOT NULL AND name NOT LIKE 'sqlite_%'"
+        ):
+            schema.execute(sql)
+
+        def costs():
+            return [plan_cost(explain(schema, q, p)) for _, q, p in queries]
+
+        existing = {
+            row[0]: row[1]
+            for row in schema.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type='index' AND sql IS NOT NULL"
+            )
+        }
+        tables = {
+            row[0]
+            for row in schema.execute(
+                "SELECT name FROM sqlite_master WHERE type='table'"
+            )
+        }
+        missing = []
+        for name, table, columns in CANDIDATE_INDEXES:
+            if name in existing or table not in tables:
+                continue
+            before = costs()
+            schema.execute(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})")
+            after = costs()
+            schema.execute(f"DROP INDEX {name}")
+            if after != before and all(a <= b for a, b in zip(after, before)):
+                missing.append((name, table, columns))
+
+        unneeded = []
+        for name, sql in existing.items():
+            if not name.startswith("btbmt_"):
+                continue
+            with_index = costs()
+            schema.execute(f"DROP INDEX {name}")
+            if all(a <= b for a, b in zip(costs(), with_index)):
+                unneeded.append(name)
+            schema.execute(sql)
+        return missing, unneeded
+    finally:
+        schema.close()
+
+
+def advise_indexes(apply=False):
+    """
+    Reports the query plans of the lookups made by the manager, the
+    indexes missing from the trade bot database and the ones it created
+    which are not needed. With `apply`, the missing indexes are created,
+    the unneeded ones dropped and the new plans are reported.
+    Changing the indexes requires the trade bot to be stopped.
+    Returns the report as a list of lines.
+    """
+    if apply and get_binance_trade_bot_process() is not None:
+        raise BotRunningError(
+            "The trade bot is running, stop it before changing the indexes."
+        )
+
+    queries = advised_queries()
+    con = sqlite3.connect(trade_db_path(), cached_statements=0)
+    try:
+        before = {name: explain(con, q, p) for name, q, p in queries}
+        missing, unneeded = review_indexes(con, queries)
+        lines = []
+        if len(missing) == 0 and len(unneeded) == 0:
+            lines.append("The indexes are up to date.")
+        for name, table, columns in missing:
+            lines.append(f"Missing index: {name} ON {table} ({', '.join(columns)})")
+        for name in unneeded:
+            lines.append(f"Unneeded index: {name}")
+
+        changed = apply and len(missing) + len(unneeded) > 0
+        if changed:
+            with con:
+                for name, table, columns in missing:
+                    con.execute(
+                        f"CREATE INDEX {name} ON {table} ({', '.join(columns)})"
+                    )
+                for name in unneeded:
+                    con.execute(f"DROP INDEX {name}")
+                con.execute("ANALYZE")
+            # the pooled connections must see the new schema
+            read_pool.close()
+            lines.append(
+                f"{len(missing)} index(es) created, {len(unneeded)} index(es) dropped."
+            )
+
+        for name, query, params in queries:
+            if before[name] is None:
+                continue
+            lines.append(f"\n{name}:")
+            lines.extend(f"  {step}" for step in before[name])
+            if changed:
+                lines.append("  now:")
+                lines.extend(f"  {step}" for step in explain(con, query, params))
+        return lines
+    finally:
+        con.close()
+
+
+def _delete_old_scouts(con, cutoff, batch_size):
+    nb_deleted = 0
+    while True:
+        with con:
+            nb = con.execute(
+                "DELETE FROM scout_history WHERE id IN (SELECT id FROM scout_history WHERE datetime < ? ORDER BY id LIMIT ?)",
+                (cutoff, batch_size),
+            ).rowcount
+        nb_deleted += nb
+        if nb < batch_size:
+            return nb_deleted
+
+
+def _thin_old_scouts(con, cutoff, batch_size):
+    # the ids grow with the datetime, so the table is walked by id ranges
+    # ending on an hour change, so that each hour is thinned at once
+    nb_deleted = 0
+    start = con.execute("SELECT MIN(id) FROM scout_history").fetchone()[0]
+    while start is not None:
+        row = con.execute(
+            "SELECT id, datetime FROM scout_history WHERE id >= ? ORDER BY id LIMIT 1 OFFSET ?",
+            (start, batch_size),
+        ).fetchone()
+        end = None
+        if row is not None:
+            end = con.execute(
+                "SELECT id FROM scout_history WHERE id >= ? AND strftime(?, datetime) != strftime(?, ?) ORDER BY id LIMIT 1",
+                (row[0], HOUR_FORMAT, HOUR_FORMAT, row[1]),
+            ).fetchone()
+            end = None if end is None else end[0]
+        if end is None:
+            end = con.execute("SELECT MAX(id) + 1 FROM scout_history").fetchone()[0]
+        with con:
+            nb_deleted += con.execute(
+                """DELETE FROM scout_history
+                WHERE id >= ? AND id < ? AND datetime < ? AND id NOT IN (
+                    SELECT MAX(id) FROM scout_history
+                    WHERE id >= ? AND id < ? AND datetime < ?
+                    GROUP BY pair_id, strftime(?, datetime)
+                )""",
+                (start, end, cutoff, start, end, cutoff, HOUR_FORMAT),
+            ).rowcount
+        if row is None or row[1] >= cutoff:
+            break
+        start = end
+    return nb_deleted
+
+
+def _vacuum(con):
+    if con.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        # the database must be rebuilt once to allow incremental vacuums
+        con.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        con.execute("VACUUM")
+    else:
+        while con.execute("PRAGMA freelist_count").fetchone()[0] > 0:
+            con.execute(f"PRAGMA incremental_vacuum({VACUUM_STEP_PAGES})").fetchall()
+    con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def prune_scouts(keep_days, hourly=False, batch_size=PRUNE_BATCH_SIZE):
+    """
+    Removes the scouts older than `keep_days` days from the trade bot
+    database, or with `hourly` only keeps the last one per pair and per hour,
+    then gives the free space back to the file system. The rows are deleted
+    in batches so that the write lock is never held for long. A backup of
+    the database is made beforehand. The trade bot must be stopped.
+    Returns a dict with the number of deleted scouts, the backup path
+    and the database size before and after.
+    """
+    if get_binance_trade_bot_process() is not None:
+        raise BotRunningError(
+            "The trade bot is running, stop it before pruning the scout history."
+        )
+
+    path = trade_db_path()
+    if not os.path.isfile(path):
+        raise FileNotFoundError(path)
+    backup_path = f"{path}.backup"
+    backup_db(path, backup_path)
+    size_before = db_size(path)
+
+    cutoff = (dt.datetime.now() - dt.timedelta(days=keep_days)).strftime(
+        "%Y-%m-%d %H:%M:%S.%f"
+    )
+    con = sqlite3.connect(path)
+    try:
+        if hourly:
+            nb_deleted = _thin_old_scouts(con, cutoff, batch_size)
+        else:
+            nb_deleted = _delete_old_scouts(con, cutoff, batch_size)
+        _vacuum(con)
+    finally:
+        con.close()
+
+    read_pool.close()
+    scout_cache.reset()
+    return {
+        "nb_deleted": nb_deleted,
+        "backup": backup_path,
+        "size_before": size_before,
+        "size_after": db_size(path),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Maintenance tools for the database of the binance-trade-bot."
+    )
+    parser.add_argument(
+        "-p",
+        "--path",
+        type=str,
+        help="(optional) binance-trade-bot installation path.",
+        default="../binance-trade-bot/",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    advise_parser = subparsers.add_parser(
+        "advise",
+        help="Report the query plans of the manager and the missing indexes.",
+    )
+    advise_parser.add_argument(
+        "--apply",
+        action="store_true",
+        help="Create the missing indexes and drop the unneeded ones. The trade bot must be stopped.",
+    )
+    prune_parser = subparsers.add_parser(
+        "prune",
+        help="Remove the old scouts and shrink the database. The trade bot must be stopped.",
+    )
+    prune_parser.add_argument(
+        "--days",
+        type=int,
+        help="(optional) Number of days of scouts to keep entirely.",
+        default=7,
+    )
+    prune_parser.add_argument(
+        "--hourly",
+        action="store_true",
+        help="Keep the last scout per pair and per hour of the older scouts instead of deleting them.",
+    )
+    prune_parser.add_argument(
+        "--batch_size",
+        type=int,
+        help="(optional) Number of scouts deleted per transaction.",
+        default=PRUNE_BATCH_SIZE,
+    )
+    export_parser = subparsers.add_parser(
+        "export",
+        help="Export a compressed copy of the database, the trade bot can keep running.",
+    )
+    export_parser.add_argument(
+        "--dest",
+        type=str,
+        help="(optional) Directory where the export is written.",
+        default=".",
+    )
+    args = parser.parse_args()
+    settings.ROOT_PATH = args.path
+
+    if args.command == "advise":
+        try:
+            print("\n".join(advise_indexes(args.apply)))
+        except BotRunningError as e:
+            parser.exit(1, f"{e}\n")
+
+    elif args.command == "prune":
+        try:
+            result = prune_scouts(args.days, args.hourly, args.batch_size)
+        except BotRunningError as e:
+            parser.exit(1, f"{e}\n")
+        print(
+            f"{result['nb_deleted']} scouts deleted, "
+            f"{format_size(result['size_before'])} -> {format_size(result['size_after'])}, "
+            f"backup saved to {result['backup']}"
+        )
+
+    elif args.command == "export":
+        print("\n".join(export_db(args.dest)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import collections
+import functools
+import os
+import sqlite3
+import threading
+import urllib.parse
+
+from btb_manager_telegram import settings
+from btb_manager_telegram.db_pool import db_replica, trade_db_path
+from btb_manager_telegram.logging import logger
+
+# cheap queries whose result changes when the trade bot writes to the table
+TABLE_SIGNATURES = {
+    "trade_history": "SELECT id, state, alt_trade_amount FROM trade_history ORDER BY id DESC LIMIT 1",
+    "scout_history": "SELECT MAX(id) FROM scout_history",
+}
+
+
+class DbWatcher(threading.Thread):
+    def __init__(self):
+        """
+        Polls `PRAGMA data_version` on a persistent connection to the
+        database read by the manager (the replica if enabled) and tells
+        the subscribers of a table when its content changed
+        """
+        super().__init__(daemon=True)
+        self.lock = threading.Lock()
+        self.subscribers = collections.defaultdict(list)
+        self.running = False
+        self.ready = False
+        self.con = None
+        self.file_id = None
+        self.data_version = None
+        self.signatures = {}
+
+    def subscribe(self, table, callback):
+        with self.lock:
+            self.subscribers[table].append(callback)
+
+    def is_running(self):
+        """
+        True once the database has been polled, the subscribers
+        can then rely on being told about the changes
+        """
+        return self.ready and self.is_alive()
+
+    def _publish(self, tables):
+        with self.lock:
+            callbacks = [c for t in tables for c in self.subscribers[t]]
+        logger.debug(f"Database change detected in {', '.join(tables)}")
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Error while handling a database change: {e}")
+
+    def _close(self):
+        if self.con is not None:
+            self.con.close()
+            self.con = None
+        self.data_version = None
+
+    def poll(self):
+        replica = db_replica.get()
+        path = replica[0] if replica is not None else trade_db_path()
+        if not os.path.isfile(path):
+            self._close()
+            self.file_id = None
+            if len(self.signatures) > 0:
+                self.signatures = {}
+                self._publish(list(TABLE_SIGNATURES))
+            return
+
+        stat = os.stat(path)
+        file_id = (path, stat.st_dev, stat.st_ino)
+        if file_id != self.file_id:
+            self._close()
+            self.file_id = file_id
+        if self.con is None:
+            self.con = sqlite3.connect(
+                f"file:{urllib.parse.quote(path)}?mode=ro",
+                uri=True,
+                check_same_thread=False,
+            )
+        data_version = self.con.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self.data_version:
+            return
+        self.data_version = data_version
+
+        changed = []
+        for table, query in TABLE_SIGNATURES.items():
+            try:
+                signature = self.con.execute(query).fetchall()
+            except sqlite3.OperationalError:
+                # the table does not exist yet
+                signature = None
+            if self.signatures.get(table) != signature:
+                self.signatures[table] = signature
+                changed.append(table)
+        if len(changed) > 0:
+            self._publish(changed)
+
+    def run(self):
+        self.running = True
+        while self.running:
+            try:
+                self.poll()
+                self.ready = True
+            except Exception as e:
+                logger.error(f"Unable to watch the database: {e}")
+                self._close()
+                # the caches cannot be trusted anymore
+                self.signatures = {}
+                self._publish(list(TABLE_SIGNATURES))
+            self.stop_event.wait(settings.DB_WATCH_INTERVAL)
+        self._close()
+
+    def start(self):
+        self.stop_event = threading.Event()
+        super().start()
+
+    def stop(self):
+        self.running = False
+        self.ready = False
+        if self.is_alive():
+            self.stop_event.set()
+
+
+db_watcher = DbWatcher()
+
+
+def cached_until_changed(*tables):
+    """
+    Caches the result of a function until one of the tables changes.
+    The cache is only used while the database watcher is running.
+    """
+
+    def decorator(fun):
+        state = {"version": 0}
+
+        def invalidate():
+            state["version"] += 1
+            state.pop("result", None)
+
+        for table in tables:
+            db_watcher.subscribe(table, invalidate)
+
+        @functools.wraps(fun)
+        def _f_cached_until_changed(*args, **kwargs):
+            if db_watcher.is_running() and "result" in state:
+                logger.debug(f"{fun.__name__} served from the cache")
+                return state["result"]
+            version = state["version"]
+            result = fun(*args, **kwargs)
+            if version == state["version"]:
+                state["result"] = result
+            return result
+
+        return _f_cached_until_changed
+
+    return decorator
@@ -5,6 +5,14 @@ def format_float(num):
     return f"{num:0.8f}".rstrip("0").rstrip(".")
 
 
+def format_size(size):
+    for unit in ["B", "kB", "MB", "GB"]:
+        if size < 1000 or unit == "GB":
+            break
+        size /= 1000
+    return f"{size:.1f} {unit}" if unit != "B" else f"{size} B"
+
+
 def escape_tg(message, exclude_parenthesis=False):
     escape_char = [".", "-", "?", "!", ">", "{", "}", "=", "+", "|"]
     if exclude_parenthesis:
@@ -19,6 +27,37 @@ def escape_tg(message, exclude_parenthesis=False):
     return escaped_message
 
 
+def split_escaped_message(message, length=telegram.constants.MAX_MESSAGE_LENGTH):
+    """
+    Splits an escaped MarkdownV2 message in messages of at most `length`
+    characters, between lines when possible. A code block cut between two
+    messages is closed at the end of the first one and reopened in the next.
+    """
+    fence = "```"
+    messages = []
+    current = ""
+    in_code = False
+    for line in message.split("\n"):
+        # overlong lines are cut, but never right after an escaping backslash
+        pieces = []
+        while len(line) > length // 2:
+            cut = length // 2
+            while cut > 1 and line[cut - 1] == "\\":
+                cut -= 1
+            pieces.append(line[:cut])
+            line = line[cut:]
+        pieces.append(line)
+        for piece in pieces:
+            closing = f"\n{fence}" if in_code else ""
+            if len(current) + len(piece) + 1 + len(closing) > length and current != "":
+                messages.append(current.rstrip("\n") + closing)
+                current = f"{fence}\n" if in_code else ""
+            current += f"{piece}\n"
+            in_code ^= piece.count(fence) % 2 == 1
+    messages.append(current.rstrip("\n"))
+    return messages
+
+
 def reply_text_escape(reply_text_fun):
     def reply_text_escape_fun(message, **kwargs):
         return reply_text_fun(escape_tg(message), **kwargs)
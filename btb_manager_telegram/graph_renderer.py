@@ -0,0 +1,159 @@
+import collections
+import concurrent.futures
+import io
+import multiprocessing
+import threading
+
+import dateutil.tz
+import matplotlib
+import matplotlib.dates as mdates
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+
+def warm_up():
+    """
+    Initializer of the rendering process: select the non
+    interactive backend and draw once to load the fonts
+    """
+    matplotlib.use("Agg")
+    draw_graph(
+        {
+            "series": [("", np.zeros(2), np.zeros(2))],
+            "ylabel": "",
+            "legend": False,
+            "figsize": None,
+        }
+    )
+
+
+def draw_graph(graph):
+    """
+    Draws a graph prepared by `report.get_graph` and returns it as PNG bytes.
+    Only the object oriented API of matplotlib is used, so that no global
+    pyplot state is shared between renders.
+    """
+    fig = Figure(figsize=graph["figsize"])
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+
+    for symbol, X, Y in graph["series"]:
+        ax.plot(X, Y, label=symbol)
+
+    # the dates are in UTC, display them in local time
+    tz = dateutil.tz.tzlocal()
+    ax.xaxis_date(tz)
+    ax.xaxis.set_major_formatter(mdates.DateFormatter("%d/%m %H:%M", tz=tz))
+    ax.tick_params(axis="x", labelrotation=15)
+    ax.set_ylabel(graph["ylabel"])
+    if graph["legend"]:
+        ax.legend(bbox_to_anchor=(1, 1), loc="upper left")
+    ax.grid()
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png")
+    return buffer.getvalue()
+
+
+class GraphRenderer:
+    def __init__(self, cache_size=32):
+        """
+        Renders the graphs in a separate, already warmed up process
+        so that drawing a large graph never blocks the telegram
+        conversation. The rendered images are cached by key.
+        """
+        self.cache_size = cache_size
+        self.lock = threading.Lock()
+        self.executor = None
+        self.cache = collections.OrderedDict()
+        self.pending = {}
+        self.file_ids = {}
+
+    def start(self):
+        with self.lock:
+            self._start()
+
+    def _start(self):
+        if self.executor is None:
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=warm_up,
+            )
+            # spawn the worker right away rather than on the first graph
+            self.executor.submit(int)
+
+    def stop(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+            pending = list(self.pending.values())
+        # shutdown only cancels the pending renders from python 3.9
+        for future in pending:
+            future.cancel()
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def get_cached(self, key):
+        """
+        Returns the cached PNG bytes for `key`, or None
+        """
+        with self.lock:
+            if key not in self.cache:
+                return None
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+    def get_file_id(self, key):
+        """
+        Returns the telegram file_id of the graph once it has been sent, or None
+        """
+        with self.lock:
+            return self.file_ids.get(key)
+
+    def set_file_id(self, key, file_id):
+        with self.lock:
+            if key in self.cache:
+                self.file_ids[key] = file_id
+
+    def render(self, key, graph):
+        """
+        Returns a future resolving to the PNG bytes of the graph.
+        Requests for a key already cached or being rendered share
+        the same result.
+        """
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                future = concurrent.futures.Future()
+                future.set_result(self.cache[key])
+                return future
+            if key in self.pending:
+                return self.pending[key]
+
+            self._start()
+            try:
+                future = self.executor.submit(draw_graph, graph)
+            except concurrent.futures.process.BrokenProcessPool:
+                # the worker died, start a new one
+                self.executor = None
+                self._start()
+                future = self.executor.submit(draw_graph, graph)
+            self.pending[key] = future
+
+        future.add_done_callback(lambda f: self._on_done(key, f))
+        return future
+
+    def _on_done(self, key, future):
+        with self.lock:
+            self.pending.pop(key, None)
+            if future.cancelled() or future.exception() is not None:
+                return
+            self.cache[key] = future.result()
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                old_key, _ = self.cache.popitem(last=False)
+                self.file_ids.pop(old_key, None)
+
+
+graph_renderer = GraphRenderer()
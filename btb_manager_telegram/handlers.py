@@ -9,7 +9,6 @@ import time
 import traceback
 
 import i18n
-import numpy as np
 import telegram
 import telegram.ext
 
@@ -24,22 +23,36 @@ from btb_manager_telegram import (
     GRAPH_MENU,
     MENU,
     PANIC_BUTTON,
+    PRUNE_SCOUTS,
     SELLING,
     SOLD,
     UPDATE_BTB,
     UPDATE_TG,
     buttons,
+    db_tools,
+    jobs,
     keyboards,
     settings,
 )
-from btb_manager_telegram.binance_api_utils import send_signed_request
+from btb_manager_telegram.binance_api_utils import get_api_url, send_signed_request
 from btb_manager_telegram.formating import (
     escape_tg,
+    format_size,
     reply_text_escape,
     telegram_text_truncator,
 )
+from btb_manager_telegram.graph_renderer import graph_renderer
+from btb_manager_telegram.jobs import job_executor
 from btb_manager_telegram.logging import logger
-from btb_manager_telegram.report import get_graph
+from btb_manager_telegram.outbox import outbox
+from btb_manager_telegram.report import (
+    add_favourite_graph,
+    get_favourite_graphs,
+    get_graph,
+    get_graph_key,
+    parse_graph_text,
+)
+from btb_manager_telegram.trade_notifier import trade_notifier
 from btb_manager_telegram.utils import (
     find_and_kill_binance_trade_bot_process,
     get_custom_scripts_keyboard,
@@ -60,13 +73,16 @@ def menu(update, _):
     # ]
 
     # modify reply_text function to have it escaping characters
-    reply_text_escape_fun = reply_text_escape(update.message.reply_text)
+    reply_text_escape_fun = reply_text_escape(outbox.reply_fun(update.message.chat))
 
     if update.message.text == "/start":
         logger.info("Started conversation.")
         message = f"{i18n.t('conversation_started')}\n" f"{i18n.t('select_option')}"
-        settings.CHAT.send_message(
-            escape_tg(message), reply_markup=keyboards.menu, parse_mode="MarkdownV2"
+        outbox.send(
+            settings.CHAT,
+            escape_tg(message),
+            reply_markup=keyboards.menu,
+            parse_mode="MarkdownV2",
         )
 
     if update.message.text in [
@@ -154,10 +170,7 @@ def menu(update, _):
         )
 
     elif update.message.text == i18n.t("keyboard.bot_stats"):
-        for mes in buttons.bot_stats():
-            reply_text_escape_fun(
-                mes, reply_markup=keyboards.menu, parse_mode="MarkdownV2"
-            )
+        reply_job(update, "bot_stats", buttons.bot_stats)
 
     elif update.message.text == i18n.t("keyboard.trade_history"):
         for mes in buttons.trade_history():
@@ -167,12 +180,8 @@ def menu(update, _):
 
     elif update.message.text == i18n.t("keyboard.graph"):
         keyboard = []
-        if os.path.isfile("data/favourite_graphs.npy"):
-            favourite_graphs = np.load(
-                "data/favourite_graphs.npy", allow_pickle=True
-            ).tolist()
-            favourite_graphs.sort(key=lambda x: -int(x[1]))
-            favourite_graphs = [i[0] for i in favourite_graphs]
+        favourite_graphs = [i[0] for i in get_favourite_graphs()]
+        if len(favourite_graphs) > 0:
             keyboard.extend(
                 [
                     favourite_graphs[3 * i : 3 * i + 3]
@@ -271,15 +280,23 @@ def menu(update, _):
             )
 
     elif update.message.text == i18n.t("keyboard.export_db"):
-        message, document = buttons.export_db()
+        reply_job(
+            update,
+            "export_db",
+            export_and_send_db,
+            priority=jobs.MAINTENANCE,
+            reply_markup=keyboards.config,
+        )
+
+    elif update.message.text == i18n.t("keyboard.trade_notifications"):
+        enabled = not trade_notifier.is_enabled()
+        trade_notifier.set_enabled(enabled)
+        logger.info(f"Trade notifications {'enabled' if enabled else 'disabled'}.")
         reply_text_escape_fun(
-            message, reply_markup=keyboards.config, parse_mode="MarkdownV2"
+            i18n.t("notification.enabled" if enabled else "notification.disabled"),
+            reply_markup=keyboards.config,
+            parse_mode="MarkdownV2",
         )
-        if document is not None:
-            settings.CHAT.send_document(
-                document=document,
-                filename="crypto_trading.db",
-            )
 
     elif update.message.text == i18n.t("keyboard.update_tgb"):
         message, status = buttons.update_tg_bot()
@@ -315,6 +332,23 @@ def menu(update, _):
                 parse_mode="MarkdownV2",
             )
 
+    elif update.message.text == i18n.t("keyboard.prune_scouts"):
+        message, status = buttons.prune_scouts()
+        if status:
+            kb = [[i18n.t("keyboard.confirm"), i18n.t("keyboard.cancel")]]
+            reply_text_escape_fun(
+                message,
+                reply_markup=telegram.ReplyKeyboardMarkup(kb, resize_keyboard=True),
+                parse_mode="MarkdownV2",
+            )
+            return PRUNE_SCOUTS
+        else:
+            reply_text_escape_fun(
+                message,
+                reply_markup=keyboards.maintenance,
+                parse_mode="MarkdownV2",
+            )
+
     elif update.message.text == i18n.t("keyboard.execute_script"):
         kb, status, message = get_custom_scripts_keyboard()
         if status:
@@ -338,7 +372,7 @@ def edit_coin(update, _):
     logger.info(f"Editing coin list. ({update.message.text})")
 
     # modify reply_text function to have it escaping characters
-    reply_text_escape_fun = reply_text_escape(update.message.reply_text)
+    reply_text_escape_fun = reply_text_escape(outbox.reply_fun(update.message.chat))
 
     if update.message.text != "/stop":
         message = (
@@ -371,7 +405,7 @@ def edit_user_config(update, _):
     logger.info(f"Editing user configuration. ({update.message.text})")
 
     # modify reply_text function to have it escaping characters
-    reply_text_escape_fun = reply_text_escape(update.message.reply_text)
+    reply_text_escape_fun = reply_text_escape(outbox.reply_fun(update.message.chat))
 
     if update.message.text != "/stop":
         message = (
@@ -407,7 +441,7 @@ def delete_db(update, _):
     )
 
     # modify reply_text function to have it escaping characters
-    reply_text_escape_fun = reply_text_escape(update.message.reply_text)
+    reply_text_escape_fun = reply_text_escape(outbox.reply_fun(update.message.chat))
 
     if update.message.text != i18n.t("keyboard.go_back"):
         message = i18n.t("db.delete.success")
@@ -444,7 +478,7 @@ def update_tg_bot(update, _):
     logger.info(f"Updating BTB Manager Telegram. ({update.message.text})")
 
     # modify reply_text function to have it escaping characters
-    reply_text_escape_fun = reply_text_escape(update.message.reply_text)
+    reply_text_escape_fun = reply_text_escape(outbox.reply_fun(update.message.chat))
 
     if update.message.text != i18n.t("keyboard.cancel_update"):
         message = i18n.t("update.tgb.updating")
@@ -501,7 +535,7 @@ def update_btb(update, _):
     logger.info(f"Updating Binance Trade Bot. ({update.message.text})")
 
     # modify reply_text function to have it escaping characters
-    reply_text_escape_fun = reply_text_escape(update.message.reply_text)
+    reply_text_escape_fun = reply_text_escape(outbox.reply_fun(update.message.chat))
 
     keyboard = [[i18n.t("keyboard.ok_s")]]
     reply_markup = telegram.ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
@@ -511,24 +545,14 @@ def update_btb(update, _):
             f"{i18n.t('update.btb.updating')}\n"
             f"{i18n.t('update.btb.start_manually')}"
         )
-        reply_text_escape_fun(
-            message, reply_markup=reply_markup, parse_mode="MarkdownV2"
+        reply_job(
+            update,
+            "update_btb",
+            update_btb_job,
+            priority=jobs.MAINTENANCE,
+            reply_markup=reply_markup,
+            working=message,
         )
-        try:
-            find_and_kill_binance_trade_bot_process()
-            subprocess.call(
-                f"cd {settings.ROOT_PATH} && "
-                f"git pull && "
-                f"{settings.PYTHON_PATH} -m pip install -r requirements.txt --upgrade",
-                shell=True,
-            )
-            settings.BTB_UPDATE_BROADCASTED_BEFORE = False
-        except Exception as e:
-            logger.error(f"Unable to update Binance Trade Bot: {e}", exc_info=True)
-            message = "Unable to update Binance Trade Bot"
-            reply_text_escape_fun(
-                message, reply_markup=reply_markup, parse_mode="MarkdownV2"
-            )
     else:
         message = (
             f"{i18n.t('exited_no_change')}\n" f"{i18n.t('update.btb.not_updated')}"
@@ -540,11 +564,36 @@ def update_btb(update, _):
     return MENU
 
 
+def prune_scouts(update, _):
+    logger.info(f"Pruning the scout history. ({update.message.text})")
+
+    keyboard = [[i18n.t("keyboard.ok_s")]]
+    reply_markup = telegram.ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+
+    if update.message.text != i18n.t("keyboard.cancel"):
+        reply_job(
+            update,
+            "prune_scouts",
+            prune_scouts_job,
+            priority=jobs.MAINTENANCE,
+            reply_markup=reply_markup,
+        )
+    else:
+        # modify reply_text function to have it escaping characters
+        reply_text_escape_fun = reply_text_escape(outbox.reply_fun(update.message.chat))
+        message = f"{i18n.t('exited_no_change')}\n" f"{i18n.t('db.prune.not_pruned')}"
+        reply_text_escape_fun(
+            message, reply_markup=reply_markup, parse_mode="MarkdownV2"
+        )
+
+    return MENU
+
+
 def panic(update, _):
     logger.info(f"Panic Button is doing its job. ({update.message.text})")
 
     # modify reply_text function to have it escaping characters
-    reply_text_escape_fun = reply_text_escape(update.message.reply_text)
+    reply_text_escape_fun = reply_text_escape(outbox.reply_fun(update.message.chat))
 
     keyboard = [[i18n.t("keyboard.great")]]
     reply_markup = telegram.ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
@@ -580,7 +629,7 @@ def panic(update, _):
             message = send_signed_request(
                 api_key,
                 api_secret_key,
-                f"https://api.binance.{tld}",
+                get_api_url(tld),
                 "POST",
                 "/api/v3/order",
                 payload=params,
@@ -591,7 +640,7 @@ def panic(update, _):
             message = send_signed_request(
                 api_key,
                 api_secret_key,
-                f"https://api.binance.{tld}",
+                get_api_url(tld),
                 "DELETE",
                 "/api/v3/openOrders",
                 payload=params,
@@ -612,7 +661,7 @@ def execute_custom_script(update, _):
     logger.info(f"Going to 🤖 execute custom script. ({update.message.text})")
 
     # modify reply_text function to have it escaping characters
-    reply_text_escape_fun = reply_text_escape(update.message.reply_text)
+    reply_text_escape_fun = reply_text_escape(outbox.reply_fun(update.message.chat))
 
     keyboard = [[i18n.t("keyboard.ok_s")]]
     reply_markup = telegram.ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
@@ -622,48 +671,38 @@ def execute_custom_script(update, _):
         with open(custom_scripts_path) as f:
             scripts = json.load(f)
 
-            try:
-                command = ["bash", "-c", str(scripts[update.message.text])]
-            except Exception as e:
-                logger.error(
-                    f"Unable to find script named {update.message.text} in custom_scripts.json file: {e}",
-                    exc_info=True,
-                )
-                message = i18n.t("script.not_found", name=update.message.text)
-                reply_text_escape_fun(
-                    message, reply_markup=reply_markup, parse_mode="MarkdownV2"
-                )
-
-            try:
-                proc = subprocess.Popen(
-                    command,
-                    stdout=subprocess.PIPE,
-                )
-                output, _ = proc.communicate()
-                message_list = telegram_text_truncator(
-                    output.decode("utf-8"),
-                    padding_chars_head="```\n",
-                    padding_chars_tail="```",
-                )
-                for message in message_list:
-                    reply_text_escape_fun(
-                        message, reply_markup=reply_markup, parse_mode="MarkdownV2"
-                    )
-            except Exception as e:
-                logger.error(f"Error during script execution: {e}", exc_info=True)
-                message = i18n.t("script.error")
-                reply_text_escape_fun(
-                    message, reply_markup=reply_markup, parse_mode="MarkdownV2"
-                )
+        try:
+            command = ["bash", "-c", str(scripts[update.message.text])]
+        except Exception as e:
+            logger.error(
+                f"Unable to find script named {update.message.text} in custom_scripts.json file: {e}",
+                exc_info=True,
+            )
+            message = i18n.t("script.not_found", name=update.message.text)
+            reply_text_escape_fun(
+                message, reply_markup=reply_markup, parse_mode="MarkdownV2"
+            )
+            return MENU
+
+        reply_job(
+            update,
+            f"script {update.message.text}",
+            lambda: run_custom_script(command),
+            priority=jobs.MAINTENANCE,
+            reply_markup=reply_markup,
+        )
 
     return MENU
 
 
 def graph_menu(update, _):
+    # modify reply_text function to have it escaping characters
+    reply_text_escape_fun = reply_text_escape(outbox.reply_fun(update.message.chat))
+
     if update.message.text == i18n.t("keyboard.go_back"):
         message = i18n.t("graph.exit")
-        update.message.reply_text(
-            escape_tg(message), reply_markup=keyboards.menu, parse_mode="MarkdownV2"
+        reply_text_escape_fun(
+            message, reply_markup=keyboards.menu, parse_mode="MarkdownV2"
         )
         return MENU
     if update.message.text == i18n.t("keyboard.new_graph"):
@@ -676,8 +715,8 @@ def graph_menu(update, _):
 - {i18n.t("graph.new_graph.g")}
 - {i18n.t("graph.new_graph.h")}
 {i18n.t("graph.new_graph.i")}"""
-        update.message.reply_text(
-            escape_tg(message),
+        reply_text_escape_fun(
+            message,
             reply_markup=telegram.ReplyKeyboardRemove(),
             parse_mode="MarkdownV2",
         )
@@ -687,76 +726,264 @@ def graph_menu(update, _):
 
 
 def create_graph(update, _):
+    # modify reply_text function to have it escaping characters
+    reply_text_escape_fun = reply_text_escape(outbox.reply_fun(update.message.chat))
+
     text = update.message.text
 
     if text == "/stop":
         message = i18n.t("graph.exit")
-        update.message.reply_text(
-            escape_tg(message), reply_markup=keyboards.menu, parse_mode="MarkdownV2"
+        reply_text_escape_fun(
+            message, reply_markup=keyboards.menu, parse_mode="MarkdownV2"
         )
         return MENU
 
-    text = [i for i in text.split(" ") if i != ""]
-
-    if not (len(text) == 2 and text[1].isdigit()):
+    parsed = parse_graph_text(text)
+    if parsed is None:
         message = i18n.t("graph.bad_graph")
-        update.message.reply_text(
-            escape_tg(message), reply_markup=keyboards.menu, parse_mode="MarkdownV2"
+        reply_text_escape_fun(
+            message, reply_markup=keyboards.menu, parse_mode="MarkdownV2"
         )
         return MENU
+    coins, days = parsed
 
-    days = int(text[1])
-    coins = text[0].upper().split(",")
-    coins.sort()
-    input_text_filtered = f"{','.join(coins)} {days}"
+    # the data is loaded by a job and the graph drawn by another process,
+    # the reply is sent once it is ready
+    job_executor.submit(
+        f"graph {','.join(coins)} {days}", lambda: prepare_graph(coins, days)
+    ).add_done_callback(lambda future: render_graph(update, coins, days, future))
+
+    return MENU
 
+
+def prepare_graph(coins, days):
+    """
+    Returns the key of the graph, and either its cached image or the
+    graph to render with its number of points
+    """
+    graph_key = get_graph_key(coins, days, "amount", "USD")
+    image = graph_renderer.get_cached(graph_key)
+    if image is not None:
+        # already rendered, most likely pre-rendered after the last snapshot
+        return graph_key, image, None, None
+    graph, nb_plot = get_graph(False, coins, days, "amount", "USD")
+    return graph_key, None, graph, nb_plot
+
+
+def render_graph(update, coins, days, future):
+    if future.cancelled():
+        return
     try:
-        figname, nb_plot = get_graph(False, coins, days, "amount", "USD")
+        graph_key, image, graph, nb_plot = future.result()
     except Exception as e:
         message = f"{i18n.t('graph.error')}\n ```\n"
-        message += "".join(traceback.format_exception(*sys.exc_info()))
+        message += "".join(traceback.format_exception(type(e), e, e.__traceback__))
         message += "\n```"
-        update.message.reply_text(
-            escape_tg(message), reply_markup=keyboards.menu, parse_mode="MarkdownV2"
+        outbox.send(
+            update.message.chat,
+            escape_tg(message),
+            reply_markup=keyboards.menu,
+            parse_mode="MarkdownV2",
         )
-        return MENU
+        return
+
+    if image is not None:
+        add_favourite_graph(coins, days)
+        job_executor.submit(
+            f"reply graph {update.update_id}",
+            lambda: reply_graph(update, graph_key, image=image),
+        )
+        return
 
     if nb_plot <= 1:
         message = i18n.t("graph.not_enough_points")
-        update.message.reply_text(
-            escape_tg(message), reply_markup=keyboards.menu, parse_mode="MarkdownV2"
+        outbox.send(
+            update.message.chat,
+            escape_tg(message),
+            reply_markup=keyboards.menu,
+            parse_mode="MarkdownV2",
         )
-        return MENU
+        return
 
-    if os.path.isfile("data/favourite_graphs.npy"):
-        favourite_graphs = np.load(
-            "data/favourite_graphs.npy", allow_pickle=True
-        ).tolist()
-    else:
-        favourite_graphs = []
-    found = False
-    for index, (graph, nb_calls) in enumerate(favourite_graphs):
-        if graph == input_text_filtered:
-            favourite_graphs[index][1] = int(nb_calls) + 1
-            found = True
-            break
-    if not found:
-        favourite_graphs.append([input_text_filtered, 1])
-    np.save("data/favourite_graphs.npy", favourite_graphs, allow_pickle=True)
-
-    with open(figname, "rb") as f:
-        update.message.reply_photo(
-            f, reply_markup=keyboards.menu, parse_mode="MarkdownV2"
+    add_favourite_graph(coins, days)
+    graph_renderer.render(graph_key, graph).add_done_callback(
+        lambda future: reply_rendered_graph(update, graph_key, future)
+    )
+
+
+def reply_rendered_graph(update, graph_key, future):
+    # the callbacks of the renderer run on its management thread,
+    # the reply is sent by a job instead
+    job_executor.submit(
+        f"reply graph {update.update_id}",
+        lambda: reply_graph(update, graph_key, future=future),
+    )
+
+
+def reply_graph(update, graph_key, image=None, future=None):
+    """
+    Sends the graph `image`, or the one rendered by `future`
+    """
+    try:
+        if future is not None:
+            image = future.result()
+        # once uploaded, telegram can send the same photo again from its file_id
+        file_id = graph_renderer.get_file_id(graph_key)
+        message = update.message.reply_photo(
+            image if file_id is None else file_id,
+            reply_markup=keyboards.menu,
+            parse_mode="MarkdownV2",
+        )
+    except Exception as e:
+        logger.error(f"Unable to send the graph: {e}", exc_info=True)
+        outbox.send(
+            update.message.chat,
+            escape_tg(f"{i18n.t('graph.error')}\n ```\n{e}\n```"),
+            reply_markup=keyboards.menu,
+            parse_mode="MarkdownV2",
         )
+        return
+    if file_id is None and len(message.photo) > 0:
+        graph_renderer.set_file_id(graph_key, message.photo[-1].file_id)
+
+
+def reply_job(
+    update, key, fun, priority=jobs.INTERACTIVE, reply_markup=None, working=None
+):
+    """
+    Runs `fun`, which returns a list of messages, as a job. A "working"
+    message is sent meanwhile, then replaced by the first message.
+    """
+    if reply_markup is None:
+        reply_markup = keyboards.menu
+    chat = update.message.chat
+    working_message = outbox.send(
+        chat,
+        escape_tg(i18n.t("job.working") if working is None else working),
+        mergeable=False,
+        reply_markup=reply_markup,
+        parse_mode="MarkdownV2",
+    )
 
-    return MENU
+    def _reply(future):
+        if future.cancelled():
+            messages = [i18n.t("job.cancelled")]
+        elif future.exception() is not None or future.result() is None:
+            messages = [i18n.t("job.error")]
+        else:
+            messages = future.result()
+
+        def _edit(sent):
+            # the first message replaces the working one once it is sent
+            if sent.exception() is None:
+                outbox.edit(
+                    sent.result(), escape_tg(messages[0]), parse_mode="MarkdownV2"
+                )
+            first = 1 if sent.exception() is None else 0
+            for message in messages[first:]:
+                outbox.send(
+                    chat,
+                    escape_tg(message),
+                    reply_markup=reply_markup,
+                    parse_mode="MarkdownV2",
+                )
+
+        working_message.add_done_callback(_edit)
+
+    job_executor.submit(key, fun, priority).add_done_callback(_reply)
+
+
+def prune_scouts_job():
+    try:
+        result = db_tools.prune_scouts(
+            settings.SCOUT_RETENTION_DAYS, settings.SCOUT_KEEP_HOURLY
+        )
+        message = i18n.t(
+            "db.prune.success",
+            nb=result["nb_deleted"],
+            before=format_size(result["size_before"]),
+            after=format_size(result["size_after"]),
+            backup=result["backup"],
+        )
+    except db_tools.BotRunningError:
+        message = i18n.t("db.prune.stop_bot")
+    except Exception as e:
+        logger.error(f"❌ Unable to prune the scout history: {e}", exc_info=True)
+        message = i18n.t("db.prune.error")
+    return [message]
+
+
+def export_and_send_db():
+    message, parts = buttons.export_db()
+    if parts is not None:
+        try:
+            for part in parts:
+                with open(part, "rb") as document:
+                    settings.CHAT.send_document(
+                        document=document,
+                        filename=os.path.basename(part),
+                        timeout=120,
+                    )
+        finally:
+            shutil.rmtree(os.path.dirname(parts[0]), ignore_errors=True)
+    return [message]
+
+
+def update_btb_job():
+    try:
+        find_and_kill_binance_trade_bot_process()
+        subprocess.call(
+            f"cd {settings.ROOT_PATH} && "
+            f"git pull && "
+            f"{settings.PYTHON_PATH} -m pip install -r requirements.txt --upgrade",
+            shell=True,
+        )
+        settings.BTB_UPDATE_BROADCASTED_BEFORE = False
+    except Exception as e:
+        logger.error(f"Unable to update Binance Trade Bot: {e}", exc_info=True)
+        return [i18n.t("update.btb.error")]
+    return [i18n.t("update.btb.updated")]
+
+
+def run_custom_script(command):
+    try:
+        proc = subprocess.Popen(
+            command,
+            stdout=subprocess.PIPE,
+        )
+        output, _ = proc.communicate()
+        return telegram_text_truncator(
+            output.decode("utf-8"),
+            padding_chars_head="```\n",
+            padding_chars_tail="```",
+        )
+    except Exception as e:
+        logger.error(f"Error during script execution: {e}", exc_info=True)
+        return [i18n.t("script.error")]
+
+
+def cancel_job(update, _):
+    nb_cancelled, nb_running = job_executor.cancel()
+    logger.info(f"{nb_cancelled} job(s) cancelled, {nb_running} running.")
+    messages = []
+    if nb_cancelled > 0:
+        messages.append(i18n.t("job.nb_cancelled", count=nb_cancelled))
+    if nb_running > 0:
+        messages.append(i18n.t("job.running", count=nb_running))
+    if len(messages) == 0:
+        messages.append(i18n.t("job.no_job"))
+    outbox.send(
+        update.message.chat,
+        escape_tg("\n".join(messages)),
+        parse_mode="MarkdownV2",
+    )
 
 
 def cancel(update, _):
     logger.info("Conversation canceled.")
 
     # modify reply_text function to have it escaping characters
-    reply_text_escape_fun = reply_text_escape(update.message.reply_text)
+    reply_text_escape_fun = reply_text_escape(outbox.reply_fun(update.message.chat))
 
     reply_text_escape_fun(
         i18n.t("bye"),
@@ -770,7 +997,7 @@ MENU_HANDLER = telegram.ext.MessageHandler(
     telegram.ext.Filters.regex(
         f"^({i18n.t('keyboard.current_value')}|{i18n.t('keyboard.panic')}|{i18n.t('keyboard.progress')}|{i18n.t('keyboard.next_coin')}|{i18n.t('keyboard.check_status')}|{i18n.t('keyboard.bot_stats')}|{i18n.t('keyboard.trade_history')}|{i18n.t('keyboard.graph')}|{i18n.t('keyboard.maintenance')}|"
         f"{i18n.t('keyboard.configurations')}|{i18n.t('keyboard.start')}|{i18n.t('keyboard.stop')}|{i18n.t('keyboard.read_logs')}|{i18n.t('keyboard.delete_db')}|"
-        f"{i18n.t('keyboard.edit_cfg')}|{i18n.t('keyboard.edit_coin_list')}|{i18n.t('keyboard.export_db')}|{i18n.t('keyboard.update_tgb')}|{i18n.t('keyboard.update_btb')}|"
+        f"{i18n.t('keyboard.edit_cfg')}|{i18n.t('keyboard.edit_coin_list')}|{i18n.t('keyboard.export_db')}|{i18n.t('keyboard.trade_notifications')}|{i18n.t('keyboard.update_tgb')}|{i18n.t('keyboard.update_btb')}|{i18n.t('keyboard.prune_scouts')}|"
         f"{i18n.t('keyboard.execute_script')}|{i18n.t('keyboard.back')}|{i18n.t('keyboard.go_back')}|{i18n.t('keyboard.ok')}|{i18n.t('keyboard.cancel_update')}|{i18n.t('keyboard.cancel')}|{i18n.t('keyboard.ok_s')}|{i18n.t('keyboard.great')})$"
     ),
     menu,
@@ -809,6 +1036,13 @@ UPDATE_BTB_HANDLER = telegram.ext.MessageHandler(
     update_btb,
 )
 
+PRUNE_SCOUTS_HANDLER = telegram.ext.MessageHandler(
+    telegram.ext.Filters.regex(
+        f"^({i18n.t('keyboard.confirm')}|{i18n.t('keyboard.cancel')})$"
+    ),
+    prune_scouts,
+)
+
 PANIC_BUTTON_HANDLER = telegram.ext.MessageHandler(
     telegram.ext.Filters.regex(
         f"^({i18n.t('keyboard.stop_sell')}|{i18n.t('keyboard.stop_cancel')}|{i18n.t('keyboard.stop_bot')}|{i18n.t('keyboard.go_back')})$"
@@ -830,3 +1064,7 @@ CREATE_GRAPH_HANDLER = telegram.ext.MessageHandler(
 
 
 FALLBACK_HANDLER = telegram.ext.CommandHandler("cancel", cancel)
+
+CANCEL_JOB_HANDLER = telegram.ext.CommandHandler(
+    "cancel_job", cancel_job, telegram.ext.Filters.chat(chat_id=eval(settings.CHAT_ID))
+)
@@ -0,0 +1,96 @@
+import concurrent.futures
+import heapq
+import itertools
+import sys
+import threading
+import traceback
+
+from btb_manager_telegram import settings
+from btb_manager_telegram.logging import logger
+
+# priority classes, the lowest runs first
+INTERACTIVE = 0
+MAINTENANCE = 1
+
+
+class Job:
+    def __init__(self, key, fun, priority):
+        self.key = key
+        self.fun = fun
+        self.priority = priority
+        self.future = concurrent.futures.Future()
+
+
+class JobExecutor:
+    def __init__(self):
+        """
+        Runs the slow actions of the buttons on a few worker threads, by
+        priority, so that the dispatcher stays responsive. A job submitted
+        while one with the same key is queued or running is not run again,
+        the future of the running one is returned instead.
+        """
+        self.condition = threading.Condition()
+        self.queue = []
+        self.jobs = {}
+        self.counter = itertools.count()
+        self.workers = []
+
+    def submit(self, key, fun, priority=INTERACTIVE):
+        """
+        Returns a `concurrent.futures.Future` of the result of `fun()`
+        """
+        with self.condition:
+            if key in self.jobs:
+                logger.info(f"Job {key} is already in progress.")
+                return self.jobs[key].future
+            job = Job(key, fun, priority)
+            self.jobs[key] = job
+            heapq.heappush(self.queue, (priority, next(self.counter), job))
+            while len(self.workers) < settings.JOB_WORKERS:
+                worker = threading.Thread(target=self._work, daemon=True)
+                worker.start()
+                self.workers.append(worker)
+            self.condition.notify()
+        return job.future
+
+    def cancel(self):
+        """
+        Cancels the queued jobs. The running jobs cannot be stopped
+        and complete. Returns the number of cancelled and running jobs.
+        """
+        nb_cancelled = 0
+        with self.condition:
+            for key, job in list(self.jobs.items()):
+                if job.future.cancel():
+                    # the workers skip it when they pop it from the queue
+                    del self.jobs[key]
+                    nb_cancelled += 1
+        return nb_cancelled, len(self.jobs)
+
+    def _work(self):
+        while True:
+            with self.condition:
+                while len(self.queue) == 0:
+                    self.condition.wait()
+                _, _, job = heapq.heappop(self.queue)
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = job.fun()
+            except Exception as e:
+                logger.error(
+                    f"Job {job.key} failed: \n```\n{''.join(traceback.format_exception(*sys.exc_info()))}\n```"
+                )
+                error = e
+            else:
+                error = None
+            with self.condition:
+                if self.jobs.get(job.key) is job:
+                    del self.jobs[job.key]
+            if error is not None:
+                job.future.set_exception(error)
+            else:
+                job.future.set_result(result)
+
+
+job_executor = JobExecutor()
@@ -17,7 +17,8 @@ config = telegram.ReplyKeyboardMarkup(
         [i18n.t("keyboard.start"), i18n.t("keyboard.stop")],
         [i18n.t("keyboard.read_logs"), i18n.t("keyboard.delete_db")],
         [i18n.t("keyboard.edit_cfg"), i18n.t("keyboard.edit_coin_list")],
-        [i18n.t("keyboard.export_db"), i18n.t("keyboard.back")],
+        [i18n.t("keyboard.export_db"), i18n.t("keyboard.trade_notifications")],
+        [i18n.t("keyboard.back")],
     ],
     resize_keyboard=True,
 )
@@ -27,6 +28,7 @@ maintenance = telegram.ReplyKeyboardMarkup(
         [i18n.t("keyboard.update_tgb")],
         [i18n.t("keyboard.execute_script")],
         [i18n.t("keyboard.update_btb")],
+        [i18n.t("keyboard.prune_scouts")],
         [i18n.t("keyboard.back")],
     ],
     resize_keyboard=True,
@@ -1,11 +1,119 @@
+import collections
+import concurrent.futures
 import logging
+import queue
 import sys
+import threading
+import time
 import traceback
 
 from telegram.utils.helpers import escape_markdown
 
 from btb_manager_telegram import settings
-from btb_manager_telegram.formating import escape_tg, telegram_text_truncator
+from btb_manager_telegram.formating import escape_tg, split_escaped_message
+from btb_manager_telegram.outbox import LOG, outbox
+
+# records waiting to be forwarded, the next ones are dropped
+LOG_BUFFER_SIZE = 100
+# identical logs are only forwarded once per window, then summarized
+LOG_DEDUP_WINDOW = 5 * 60
+# at most this many distinct logs are counted, the oldest are forgotten first
+LOG_DEDUP_SIZE = 1000
+# seconds to wait for the forwarded logs to be sent before forwarding the next ones
+LOG_SEND_TIMEOUT = 60
+
+
+class LogForwarder(threading.Thread):
+    def __init__(self):
+        """
+        Forwards the logs to the telegram conversation from its own thread.
+        A log which was already forwarded in the last `LOG_DEDUP_WINDOW`
+        seconds is counted instead, and the count is sent at the end of the
+        window. At most `LOG_BUFFER_SIZE` logs wait to be forwarded, and a
+        single message waits in the outbox, so a flood of errors is dropped
+        rather than kept in memory. At most `LOG_DEDUP_SIZE` distinct logs
+        are counted.
+        """
+        super().__init__(daemon=True)
+        self.queue = queue.Queue(LOG_BUFFER_SIZE)
+        self.lock = threading.Lock()
+        # message -> [window start, count], oldest window first
+        self.seen = collections.OrderedDict()
+        self.nb_dropped = 0
+
+    def put(self, message):
+        """
+        Never blocks
+        """
+        with self.lock:
+            if not self.is_alive():
+                self.start()
+            if message in self.seen:
+                self.seen[message][1] += 1
+                return
+            try:
+                self.queue.put_nowait(message)
+            except queue.Full:
+                self.nb_dropped += 1
+                return
+            self.seen[message] = [time.monotonic(), 0]
+            if len(self.seen) > LOG_DEDUP_SIZE:
+                # its repetitions will not be summarized
+                self.nb_dropped += self.seen.popitem(last=False)[1][1]
+
+    def _collect(self):
+        """
+        Returns the texts to forward
+        """
+        texts = []
+        try:
+            texts.append(self.queue.get(timeout=1))
+            while True:
+                texts.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        now = time.monotonic()
+        minutes = LOG_DEDUP_WINDOW // 60
+        with self.lock:
+            renewed = []
+            while len(self.seen) > 0:
+                message, (window_start, count) = next(iter(self.seen.items()))
+                if now - window_start < LOG_DEDUP_WINDOW:
+                    break
+                del self.seen[message]
+                if count > 0:
+                    texts.append(f"{message}\n×{count} in last {minutes} minutes")
+                    renewed.append(message)
+            for message in renewed:
+                self.seen[message] = [now, 0]
+            if self.nb_dropped > 0:
+                texts.append(
+                    f"⚠️ Warning : {self.nb_dropped} logs dropped, too many were sent"
+                )
+                self.nb_dropped = 0
+        return texts
+
+    def run(self):
+        while True:
+            texts = self._collect()
+            if len(texts) == 0:
+                continue
+            message = escape_tg("\n\n".join(texts), exclude_parenthesis=True)
+            try:
+                futures = [
+                    outbox.send(
+                        settings.CHAT, msg, priority=LOG, parse_mode="MarkdownV2"
+                    )
+                    for msg in split_escaped_message(message)
+                ]
+                concurrent.futures.wait(futures, timeout=LOG_SEND_TIMEOUT)
+            except Exception as e:
+                # do not use logging.error here! it will end badly.
+                print(f"The latest error cannot be sent to telegram, reason : {e}")
+
+
+log_forwarder = LogForwarder()
 
 
 class LoggerHandler(logging.Handler):
@@ -17,8 +125,6 @@ class LoggerHandler(logging.Handler):
         super().__init__()
 
     def emit(self, record):
-        if record.levelno >= logging.WARNING:  # warning, critical or error
-            emoji = ""
         if record.levelno == logging.WARNING:
             emoji = "⚠️"
         elif record.levelno == logging.ERROR:
@@ -27,17 +133,7 @@ class LoggerHandler(logging.Handler):
             emoji = "☠️"
         else:
             return
-        message = f"{emoji} {record.levelname.title()} : {record.msg}"
-        message_list = telegram_text_truncator(message)
-        for msg in message_list:
-            try:
-                settings.CHAT.send_message(
-                    escape_tg(message, exclude_parenthesis=True),
-                    parse_mode="MarkdownV2",
-                )
-            except Exception as e:
-                # do not use logging.error here! it will end badly.
-                print(f"The latest error cannot be sent to telegram, reason : {e}")
+        log_forwarder.put(f"{emoji} {record.levelname.title()} : {record.msg}")
 
 
 logging.basicConfig(
@@ -86,7 +182,4 @@ def tg_error_handler(update, context):
         error = context.error
     else:
         error = "".join(traceback.format_exception(*error))
-    message = f"```\n{error}\n```"
-    settings.CHAT.send_message(
-        escape_tg(message, exclude_parenthesis=True), parse_mode="MarkdownV2"
-    )
+    log_forwarder.put(f"```\n{error}\n```")
@@ -0,0 +1,266 @@
+import collections
+import concurrent.futures
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+import telegram
+
+# btb_manager_telegram.logging sends through the outbox, so its logger
+# is looked up by name rather than imported
+logger = logging.getLogger("btb_manager_telegram")
+
+# priority classes, the lowest is sent first
+INTERACTIVE = 0
+NOTIFICATION = 1
+LOG = 2
+
+# telegram allows about 30 messages per second overall
+# and about one message per second in a given chat
+GLOBAL_RATE = 30
+GLOBAL_BURST = 30
+CHAT_RATE = 1
+CHAT_BURST = 5
+NB_LATENCIES = 100
+# options of send_message which must be equal for two messages to be merged
+MERGE_OPTIONS = ("parse_mode", "disable_web_page_preview", "disable_notification")
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+
+    def _fill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def delay(self, now):
+        """
+        Seconds to wait before a token is available
+        """
+        self._fill(now)
+        return max(0, (1 - self.tokens) / self.rate)
+
+    def take(self, now):
+        self._fill(now)
+        self.tokens -= 1
+
+    def block(self, seconds):
+        """
+        No token is available for `seconds` seconds
+        """
+        self._fill(time.monotonic())
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+
+class Outgoing:
+    def __init__(self, chat, text, priority, mergeable, kwargs, edited=None):
+        self.chat = chat
+        self.edited = edited
+        self.text = text
+        self.priority = priority
+        self.mergeable = mergeable
+        self.kwargs = kwargs
+        self.created = time.monotonic()
+        self.futures = [concurrent.futures.Future()]
+        self.created_list = [self.created]
+
+    def can_merge(self, other):
+        if not (self.mergeable and other.mergeable):
+            return False
+        if self.edited is not None or other.edited is not None:
+            return False
+        if other.chat.id != self.chat.id or other.priority != self.priority:
+            return False
+        if len(self.text) + 1 + len(other.text) > telegram.constants.MAX_MESSAGE_LENGTH:
+            return False
+        if any(self.kwargs.get(k) != other.kwargs.get(k) for k in MERGE_OPTIONS):
+            return False
+        # the keyboard of the last message is kept
+        markup = self.kwargs.get("reply_markup")
+        return markup is None or markup == other.kwargs.get("reply_markup")
+
+    def merge(self, other):
+        self.text = f"{self.text}\n{other.text}"
+        self.kwargs = other.kwargs
+        self.futures.extend(other.futures)
+        self.created_list.extend(other.created_list)
+
+
+class Outbox(threading.Thread):
+    def __init__(self):
+        """
+        Queue of the messages sent to telegram. The messages are sent by
+        priority, within a global and a per chat rate limit, and adjacent
+        small messages to the same chat are merged. A message which gets
+        a `RetryAfter` error is sent again once the delay has passed.
+        """
+        super().__init__(daemon=True)
+        self.condition = threading.Condition()
+        self.queue = []
+        self.counter = itertools.count()
+        self.global_bucket = TokenBucket(GLOBAL_RATE, GLOBAL_BURST)
+        self.chat_buckets = {}
+        self.running = True
+        self.latencies = collections.deque(maxlen=NB_LATENCIES)
+        self.nb_sent = 0
+        self.nb_merged = 0
+        self.nb_retries = 0
+        self.nb_failed = 0
+
+    def send(self, chat, text, priority=INTERACTIVE, mergeable=True, **kwargs):
+        """
+        Queues a message for `chat`, a `telegram.Chat`. The keyword arguments
+        are the ones of `send_message`. Returns a `concurrent.futures.Future`
+        of the sent `telegram.Message`, which may hold several merged messages.
+        """
+        if chat is None:
+            raise ValueError("There is no chat to send the message to.")
+        message = Outgoing(chat, text, priority, mergeable, kwargs)
+        with self.condition:
+            heapq.heappush(self.queue, (priority, next(self.counter), message))
+            self.condition.notify()
+        return message.futures[0]
+
+    def edit(self, message, text, priority=INTERACTIVE, **kwargs):
+        """
+        Queues the replacement of the text of `message`, a sent
+        `telegram.Message`. The keyword arguments are the ones
+        of `edit_message_text`. Returns a `concurrent.futures.Future`.
+        """
+        outgoing = Outgoing(message.chat, text, priority, False, kwargs, message)
+        with self.condition:
+            heapq.heappush(self.queue, (priority, next(self.counter), outgoing))
+            self.condition.notify()
+        return outgoing.futures[0]
+
+    def reply_fun(self, chat, priority=INTERACTIVE):
+        """
+        Returns a function with the signature of `reply_text`
+        sending its messages to `chat` through the queue
+        """
+
+        def _reply(text, **kwargs):
+            return self.send(chat, text, priority=priority, **kwargs)
+
+        return _reply
+
+    def _next(self):
+        """
+        Pops the next message, merged with the following ones when
+        possible, once the rate limits allow it to be sent
+        """
+        with self.condition:
+            while True:
+                if len(self.queue) == 0:
+                    if not self.running:
+                        return None
+                    self.condition.wait()
+                    continue
+                now = time.monotonic()
+                message = self.queue[0][2]
+                chat_bucket = self.chat_buckets.setdefault(
+                    message.chat.id, TokenBucket(CHAT_RATE, CHAT_BURST)
+                )
+                delay = max(self.global_bucket.delay(now), chat_bucket.delay(now))
+                if delay > 0:
+                    # a message with a higher priority may come meanwhile
+                    self.condition.wait(delay)
+                    continue
+                heapq.heappop(self.queue)
+                while len(self.queue) > 0 and message.can_merge(self.queue[0][2]):
+                    message.merge(heapq.heappop(self.queue)[2])
+                    self.nb_merged += 1
+                self.global_bucket.take(now)
+                chat_bucket.take(now)
+                return message
+
+    def run(self):
+        while True:
+            message = self._next()
+            if message is None:
+                return
+            try:
+                if message.edited is not None:
+                    result = message.chat.bot.edit_message_text(
+                        message.text,
+                        chat_id=message.chat.id,
+                        message_id=message.edited.message_id,
+                        **message.kwargs,
+                    )
+                else:
+                    result = message.chat.bot.send_message(
+                        message.chat.id, message.text, **message.kwargs
+                    )
+            except telegram.error.RetryAfter as e:
+                with self.condition:
+                    self.nb_retries += 1
+                    self.global_bucket.block(e.retry_after)
+                    self.chat_buckets[message.chat.id].block(e.retry_after)
+                    heapq.heappush(
+                        self.queue, (message.priority, -next(self.counter), message)
+                    )
+                continue
+            except Exception as e:
+                # do not use logging.error here, the error would be sent to telegram
+                print(f"A message cannot be sent to telegram, reason : {e}")
+                self.nb_failed += 1
+                for future in message.futures:
+                    future.set_exception(e)
+                continue
+
+            now = time.monotonic()
+            self.nb_sent += 1
+            self.latencies.extend(now - created for created in message.created_list)
+            for future in message.futures:
+                future.set_result(result)
+
+    def get_metrics(self):
+        with self.condition:
+            depth = collections.Counter(priority for priority, _, _ in self.queue)
+            latencies = sorted(self.latencies)
+        return {
+            "depth": {
+                name: depth[priority]
+                for name, priority in (
+                    ("interactive", INTERACTIVE),
+                    ("notification", NOTIFICATION),
+                    ("log", LOG),
+                )
+            },
+            "latency_median": latencies[len(latencies) // 2] if latencies else None,
+            "latency_max": latencies[-1] if latencies else None,
+            "sent": self.nb_sent,
+            "merged": self.nb_merged,
+            "retries": self.nb_retries,
+            "failed": self.nb_failed,
+        }
+
+    def log_metrics(self):
+        metrics = self.get_metrics()
+        if metrics["latency_max"] is None:
+            return
+        logger.info(
+            f"Outbox: queued {metrics['depth']}, "
+            f"latency median {metrics['latency_median']:.2f}s max {metrics['latency_max']:.2f}s, "
+            f"{metrics['sent']} sent, {metrics['merged']} merged, "
+            f"{metrics['retries']} retries, {metrics['failed']} failed"
+        )
+
+    def stop(self, timeout=5):
+        """
+        Sends the queued messages, for at most `timeout` seconds
+        """
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.is_alive():
+            self.join(timeout)
+
+
+outbox = Outbox()
@@ -0,0 +1,66 @@
+import json
+import threading
+import time
+
+from btb_manager_telegram import settings
+from btb_manager_telegram.binance_api_utils import get_api_url, http_session
+from btb_manager_telegram.logging import logger
+
+
+class PriceOracle:
+    def __init__(self):
+        """
+        Short lived cache of the binance prices, indexed by pair
+        (e.g. `BTCUSDT`). The missing or expired prices are fetched
+        all at once with the multi-symbol form of the ticker endpoint.
+        """
+        self.lock = threading.Lock()
+        self.prices = {}
+
+    def seed(self, tickers_raw, timestamp=None):
+        """
+        Fill the cache with a list of tickers as returned by
+        the binance ticker endpoint: `[{"symbol": ..., "price": ...}]`
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        with self.lock:
+            for ticker in tickers_raw:
+                self.prices[ticker["symbol"]] = (float(ticker["price"]), timestamp)
+
+    def _fetch(self, pairs):
+        url = f"{get_api_url()}/api/v3/ticker/price"
+        response = http_session.get(
+            url, params={"symbols": json.dumps(pairs, separators=(",", ":"))}
+        )
+        if response.status_code == 400:
+            # at least one pair does not exist, which makes binance reject
+            # the whole request: fall back on the full ticker list
+            logger.debug(f"Batch price lookup rejected for {pairs}")
+            response = http_session.get(url)
+        response.raise_for_status()
+        return response.json()
+
+    def get_prices(self, pairs):
+        """
+        Returns a dict with the price of each pair. The prices older than
+        `settings.PRICE_TTL` seconds are refreshed in a single request.
+        Raises a KeyError if a pair is not traded on binance.
+        """
+        now = time.time()
+        with self.lock:
+            missing = [
+                pair
+                for pair in set(pairs)
+                if pair not in self.prices
+                or now - self.prices[pair][1] > settings.PRICE_TTL
+            ]
+        if len(missing) > 0:
+            self.seed(self._fetch(sorted(missing)), now)
+        with self.lock:
+            return {pair: self.prices[pair][0] for pair in pairs}
+
+    def get_price(self, ticker, bridge):
+        return self.get_prices([f"{ticker}{bridge}"])[f"{ticker}{bridge}"]
+
+
+price_oracle = PriceOracle()
@@ -1,4 +1,3 @@
-import datetime as dt
 import os
 import shutil
 import sys
@@ -6,16 +5,24 @@ import time
 import traceback
 import warnings
 
-import binance
 import i18n
 import matplotlib.dates as mdates
-import matplotlib.pyplot as plt
 import numpy as np
-import requests
 
 from btb_manager_telegram import settings
+from btb_manager_telegram.binance_api_utils import (
+    LOW_PRIORITY,
+    get_binance_client,
+    get_connection_stats,
+    http_session,
+    request_priority,
+)
 from btb_manager_telegram.formating import escape_tg
+from btb_manager_telegram.graph_renderer import graph_renderer
 from btb_manager_telegram.logging import if_exception_log, logger
+from btb_manager_telegram.price_oracle import price_oracle
+from btb_manager_telegram.report_history import report_history
+from btb_manager_telegram.report_store import migrate_npy_reports, report_store
 from btb_manager_telegram.schedule import scheduler
 
 warnings.filterwarnings("ignore", category=UserWarning)
@@ -30,11 +37,14 @@ def reports_path():
 
 def migrate_reports():
     """
-    Used to migrate report placement from v1.1.1 to v1.2
+    Used to migrate report placement from v1.1.1 to v1.2,
+    then from the numpy file to the append-only report store
     """
 
     if os.path.isfile("data/crypto.npy"):
         shutil.move("data/crypto.npy", reports_path())
+    if os.path.isfile(reports_path()):
+        migrate_npy_reports(reports_path())
 
 
 def build_ticker(all_symbols, tickers_raw):
@@ -69,9 +79,7 @@ def build_ticker(all_symbols, tickers_raw):
 
 
 def get_report():
-    api = binance.Client(
-        settings.BINANCE_API_KEY, settings.BINANCE_API_SECRET, tld=settings.TLD
-    )
+    api = get_binance_client()
 
     account = api.get_account()
     account_symbols = []
@@ -96,11 +104,12 @@ def get_report():
     if settings.CURRENCY == "EUR":
         all_symbols.append("EUR")
     tickers_raw = api.get_symbol_ticker()
+    price_oracle.seed(tickers_raw)
     tickers = build_ticker(all_symbols, tickers_raw)
     if settings.CURRENCY not in ("USD", "EUR"):
         ticker = (
             1
-            / requests.get(
+            / http_session.get(
                 "https://openexchangerates.org/api/latest.json?app_id="
                 + settings.OER_KEY
             ).json()["rates"][settings.CURRENCY]
@@ -123,29 +132,108 @@ def get_report():
     return report
 
 
-def get_previous_reports():
-    if os.path.exists(reports_path()):
-        reports = np.load(reports_path(), allow_pickle=True).tolist()
-        return reports
-    else:
-        return []
-
-
-def save_report(report, old_reports):
+def save_report(report):
     report["time"] = int(time.time())
-    old_reports.append(report)
-    np.save(reports_path(), old_reports, allow_pickle=True)
-    return old_reports
+    report_store.append(report)
+    report_history.add(report)
+    return report
 
 
 def make_snapshot():
     logger.info("Retreive balance information from binance")
-    crypto_report = get_report()
-    crypto_reports = save_report(crypto_report, get_previous_reports())
+    with request_priority(LOW_PRIORITY):
+        crypto_report = get_report()
+    save_report(crypto_report)
     logger.info("Snapshot saved")
+    logger.debug(f"Binance http connections: {get_connection_stats()}")
+    prerender_favourite_graphs()
+
+
+def compact_reports():
+    """
+    Incrementally applies the retention tiers to the report store
+    """
+    nb_rollups = report_store.compact(settings.REPORT_RETENTION, time.time())
+    if nb_rollups > 0:
+        logger.info(f"{nb_rollups} report rollups made")
+        report_history.reset()
+
+
+def get_graph_series(symbols, days, graph_type, ref_currency, relative):
+    """
+    Computes the series of all the given symbols at once.
+    Returns the dates as matplotlib date numbers, the symbols
+    that have at least one point, and a matrix with one column
+    per symbol holding nan where the symbol has no valid price.
+    """
+    min_timestamp = None
+    if days != 0:
+        min_timestamp = time.time() - days * 24 * 60 * 60
+    reports = report_history.window(start=min_timestamp)
+    times, total_usdt, prices = reports.times, reports.total_usdt, reports.prices
+    columns = reports.symbols
+
+    for symbol in symbols:
+        if symbol not in columns:
+            logger.debug(f"{symbol} has no price in the reports")
+    symbols = [s for s in symbols if s in columns]
+    tickers = prices[:, [columns[s] for s in symbols]]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if graph_type == "amount":
+            Y = total_usdt[:, np.newaxis] / tickers
+        elif graph_type == "price":
+            ref_currency_tickers = np.ones(len(times))
+            if ref_currency not in ("USD", "USDT"):
+                ref_currency_tickers = np.full(len(times), np.nan)
+                if ref_currency in columns:
+                    ref_currency_tickers = prices[:, columns[ref_currency]]
+            Y = tickers / ref_currency_tickers[:, np.newaxis]
+        else:
+            Y = np.full(tickers.shape, np.nan)
+    # missing or null prices end up as nan or inf
+    Y[~np.isfinite(Y)] = np.nan
+
+    has_points = ~np.all(np.isnan(Y), axis=0)
+    symbols = [s for s, keep in zip(symbols, has_points) if keep]
+    Y = Y[:, has_points]
+
+    if relative and Y.shape[1] > 0:
+        first_points = Y[np.argmax(~np.isnan(Y), axis=0), np.arange(Y.shape[1])]
+        Y = (Y / first_points - 1) * 100
+
+    X = mdates.date2num(times.astype("datetime64[s]"))
+    return X, symbols, Y
+
+
+def downsample(y, nb_points):
+    """
+    Min/max bucketing: splits the series in nb_points / 2 buckets
+    and keeps the lowest and highest point of each, plus both ends,
+    so that peaks and drawdowns are preserved.
+    Returns the sorted indices of the kept points.
+    """
+    nb_buckets = max(nb_points // 2, 1)
+    if len(y) <= nb_points:
+        return np.arange(len(y))
+    y = np.asarray(y)
+    # evenly sized buckets, none of them is empty as len(y) > nb_buckets
+    bounds = np.linspace(0, len(y), nb_buckets + 1).astype(int)
+    starts, bucket_of = bounds[:-1], np.repeat(np.arange(nb_buckets), np.diff(bounds))
+    indices = [[0, len(y) - 1]]
+    for extremum in (np.minimum.reduceat(y, starts), np.maximum.reduceat(y, starts)):
+        # first index of the extremum in each bucket
+        candidates = np.flatnonzero(y == extremum[bucket_of])
+        _, first = np.unique(bucket_of[candidates], return_index=True)
+        indices.append(candidates[first])
+    return np.unique(np.concatenate(indices))
 
 
 def get_graph(relative, symbols, days, graph_type, ref_currency):
+    """
+    Prepares a graph to be drawn by the graph renderer.
+    Returns the graph description and the number of plotted points.
+    """
     if symbols == ["*"]:
         symbols = settings.COIN_LIST
     else:
@@ -153,80 +241,109 @@ def get_graph(relative, symbols, days, graph_type, ref_currency):
             assert s in settings.COIN_LIST + [settings.CURRENCY] + additional_coins
     if len(symbols) > 1:
         relative = True
-    reports = get_previous_reports()
-
-    plt.clf()
-    plt.close()
-    if len(symbols) < 10:
-        plt.figure()
-    else:
-        plt.figure(figsize=(10, 6))
 
-    min_timestamp = 0
-    if days != 0:
-        min_timestamp = time.time() - days * 24 * 60 * 60
-
-    nb_plot = 0
-    for symbol in symbols:
-        X, Y = [], []
-        for report in reports:
-            if report["time"] < min_timestamp:
-                continue  # skip if too recent
-            if symbol not in report["tickers"]:
-                ts = report["time"]
-                logger.debug(f"{symbol} has no price in the report with timestamp {ts}")
-                continue
-            ticker = report["tickers"][symbol]
-            if ticker == 0:
-                ts = report["time"]
-                logger.debug(
-                    f"{symbol} has an invalid price in the report with timestamp {ts}"
-                )
-                continue
-
-            y = None
-            if graph_type == "amount":
-                y = report["total_usdt"] / ticker
-            elif graph_type == "price":
-                ref_currency_ticker = 1
-                if ref_currency not in ("USD", "USDT"):
-                    if ref_currency not in report["tickers"]:
-                        continue
-                    ref_currency_ticker = report["tickers"][ref_currency]
-                    if ref_currency_ticker == 0:
-                        continue
-                y = ticker / ref_currency_ticker
-            if y is None:
-                continue
-
-            Y.append(y)
-            X.append(dt.datetime.fromtimestamp(report["time"]))
-            nb_plot += 1
-
-        if len(Y) == 0:
-            continue
-
-        if relative:
-            Y = np.array(Y)
-            Y = (Y / Y[0] - 1) * 100
-        plt.plot(X, Y, label=symbol)
-
-    plt.gca().xaxis.set_major_formatter(mdates.DateFormatter("%d/%m %H:%M"))
-    plt.setp(plt.xticks()[1], rotation=15)
+    X, plotted_symbols, Y = get_graph_series(
+        symbols, days, graph_type, ref_currency, relative
+    )
+    valid = ~np.isnan(Y)
+    nb_plot = int(np.count_nonzero(valid))
+
+    series = []
+    for i_symbol, symbol in enumerate(plotted_symbols):
+        x, y = X[valid[:, i_symbol]], Y[valid[:, i_symbol], i_symbol]
+        if settings.GRAPH_POINTS > 0:
+            kept = downsample(y, settings.GRAPH_POINTS)
+            x, y = x[kept], y[kept]
+        series.append((symbol, x, y))
+
+    ylabel = ""
+    legend = False
     if graph_type == "amount":
         if relative:
-            plt.ylabel(i18n.t("graph.relative_amount"))
-            plt.legend(bbox_to_anchor=(1, 1), loc="upper left")
+            ylabel = i18n.t("graph.relative_amount")
+            legend = True
         else:
-            label = i18n.t("graph.amount")
-            label += f" ({symbols[0]})" if len(symbols) == 1 else ""
-            plt.ylabel(label)
+            ylabel = i18n.t("graph.amount")
+            ylabel += f" ({symbols[0]})" if len(symbols) == 1 else ""
     elif graph_type == "price":
         if relative:
-            plt.ylabel(i18n.t("graph.relative_price", currency=ref_currency))
+            ylabel = i18n.t("graph.relative_price", currency=ref_currency)
         else:
-            plt.ylabel(i18n.t("graph.price", currency=ref_currency))
-    plt.grid()
-    figname = f"data/quantity_{symbol}.png"
-    plt.savefig(figname)
-    return figname, nb_plot
+            ylabel = i18n.t("graph.price", currency=ref_currency)
+
+    graph = {
+        "series": series,
+        "ylabel": ylabel,
+        "legend": legend,
+        "figsize": None if len(symbols) < 10 else (10, 6),
+    }
+    return graph, nb_plot
+
+
+def get_graph_key(symbols, days, graph_type, ref_currency):
+    """
+    Cache key of a graph, which changes with each new snapshot
+    """
+    return (tuple(symbols), days, graph_type, ref_currency, report_history.latest())
+
+
+def parse_graph_text(text):
+    """
+    Parses a graph request of the form `COIN1,COIN2 NumberOfDays`.
+    Returns the sorted list of coins and the number of days,
+    or None if the request is badly formatted.
+    """
+    text = [i for i in text.split(" ") if i != ""]
+    if not (len(text) == 2 and text[1].isdigit()):
+        return None
+    coins = text[0].upper().split(",")
+    coins.sort()
+    return coins, int(text[1])
+
+
+def favourite_graphs_path():
+    return os.path.join("data", "favourite_graphs.npy")
+
+
+def get_favourite_graphs():
+    """
+    Returns the favourite graphs as [text, nb_calls], the most used first
+    """
+    if not os.path.isfile(favourite_graphs_path()):
+        return []
+    favourite_graphs = np.load(favourite_graphs_path(), allow_pickle=True).tolist()
+    favourite_graphs.sort(key=lambda x: -int(x[1]))
+    return favourite_graphs
+
+
+def add_favourite_graph(coins, days):
+    graph_text = f"{','.join(coins)} {days}"
+    favourite_graphs = get_favourite_graphs()
+    found = False
+    for index, (favourite_text, nb_calls) in enumerate(favourite_graphs):
+        if favourite_text == graph_text:
+            favourite_graphs[index][1] = int(nb_calls) + 1
+            found = True
+            break
+    if not found:
+        favourite_graphs.append([graph_text, 1])
+    np.save(favourite_graphs_path(), favourite_graphs, allow_pickle=True)
+
+
+def prerender_favourite_graphs():
+    """
+    Renders the most used graphs in the background, so that
+    they are ready when the user asks for them
+    """
+    for graph_text, _ in get_favourite_graphs()[: settings.PRERENDER_GRAPHS]:
+        parsed = parse_graph_text(graph_text)
+        if parsed is None:
+            continue
+        coins, days = parsed
+        try:
+            graph, nb_plot = get_graph(False, coins, days, "amount", "USD")
+        except Exception as e:
+            logger.debug(f"Cannot pre-render the graph `{graph_text}`: {e}")
+            continue
+        if nb_plot > 1:
+            graph_renderer.render(get_graph_key(coins, days, "amount", "USD"), graph)
@@ -0,0 +1,131 @@
+import collections
+import threading
+
+import numpy as np
+
+from btb_manager_telegram.report_store import report_store
+
+VECTORS = ["times", "periods", "total_usdt", "usdt_min", "usdt_max"]
+ReportWindow = collections.namedtuple(
+    "ReportWindow", VECTORS + ["prices", "balances", "symbols"]
+)
+
+
+class ReportHistory:
+    def __init__(self):
+        """
+        Columnar in-memory view of the reports: one row per report,
+        one column per symbol. Missing prices and balances are NaN.
+        It is loaded from the report store on first use and then
+        kept up to date as the snapshots are saved.
+        """
+        self.lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self.loaded = False
+        self.symbols = {}
+        self.size = 0
+        for name in VECTORS:
+            setattr(self, name, np.empty(0))
+        self.prices = np.empty((0, 0))
+        self.balances = np.empty((0, 0))
+
+    def _reserve(self, nb_rows, nb_cols):
+        cap_rows, cap_cols = self.prices.shape
+        if nb_rows <= cap_rows and nb_cols <= cap_cols:
+            return
+        # rows and columns grow on their own, a new symbol does not add rows
+        new_rows = cap_rows if nb_rows <= cap_rows else max(nb_rows, 2 * cap_rows, 64)
+        new_cols = cap_cols if nb_cols <= cap_cols else max(nb_cols, 2 * cap_cols)
+        for name in VECTORS:
+            vector = np.full(new_rows, np.nan)
+            vector[: self.size] = getattr(self, name)[: self.size]
+            setattr(self, name, vector)
+        prices = np.full((new_rows, new_cols), np.nan)
+        prices[: self.size, :cap_cols] = self.prices[: self.size]
+        balances = np.full((new_rows, new_cols), np.nan)
+        balances[: self.size, :cap_cols] = self.balances[: self.size]
+        self.prices, self.balances = prices, balances
+
+    def _column(self, symbol):
+        if symbol not in self.symbols:
+            self.symbols[symbol] = len(self.symbols)
+        return self.symbols[symbol]
+
+    def _add(self, report):
+        prices = [(self._column(s), p) for s, p in report["tickers"].items()]
+        balances = [(self._column(s), b) for s, b in report["balances"].items()]
+        self._reserve(self.size + 1, len(self.symbols))
+        row = self.size
+        self.times[row] = report["time"]
+        self.periods[row] = report.get("period", 0)
+        self.total_usdt[row] = report["total_usdt"]
+        self.usdt_min[row] = report.get("usdt_min", report["total_usdt"])
+        self.usdt_max[row] = report.get("usdt_max", report["total_usdt"])
+        for col, price in prices:
+            self.prices[row, col] = price
+        for col, balance in balances:
+            self.balances[row, col] = balance
+        self.size += 1
+        if row > 0 and self.times[row] < self.times[row - 1]:
+            # sorted into new arrays, the windows already returned are views
+            order = np.argsort(self.times[: self.size], kind="stable")
+            for name in VECTORS + ["prices", "balances"]:
+                array = getattr(self, name).copy()
+                array[: self.size] = array[: self.size][order]
+                setattr(self, name, array)
+
+    def _load(self):
+        if not self.loaded:
+            for report in report_store.iter_reports():
+                self._add(report)
+            self.loaded = True
+
+    def add(self, report):
+        """
+        Add a newly saved report. Nothing is done if the history
+        has not been loaded yet, as it will be read from the store.
+        """
+        with self.lock:
+            if self.loaded:
+                self._add(report)
+
+    def reset(self):
+        """
+        Forget the loaded reports, they will be read again
+        from the store on next use
+        """
+        with self.lock:
+            self._clear()
+
+    def window(self, start=None, end=None):
+        """
+        Returns a ReportWindow with the reports having `start <= time < end`.
+        `periods` is the duration covered by each report, 0 for a snapshot
+        and the tier resolution for a rollup. `usdt_min` and `usdt_max` are
+        the extremes of total_usdt over that duration.
+        """
+        with self.lock:
+            self._load()
+            times = self.times[: self.size]
+            i_start = 0 if start is None else np.searchsorted(times, start, "left")
+            i_end = self.size if end is None else np.searchsorted(times, end, "left")
+            nb_cols = len(self.symbols)
+            return ReportWindow(
+                *[getattr(self, name)[i_start:i_end] for name in VECTORS],
+                self.prices[i_start:i_end, :nb_cols],
+                self.balances[i_start:i_end, :nb_cols],
+                dict(self.symbols),
+            )
+
+    def latest(self):
+        """
+        Time of the most recent report, or None
+        """
+        with self.lock:
+            self._load()
+            return self.times[self.size - 1] if self.size > 0 else None
+
+
+report_history = ReportHistory()
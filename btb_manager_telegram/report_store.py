@@ -0,0 +1,278 @@
+import json
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+from btb_manager_telegram import settings
+from btb_manager_telegram.logging import logger
+
+SYNC_MODES = {"off": "OFF", "normal": "NORMAL", "full": "FULL"}
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+ROLLUP_COLUMNS = [
+    ("period", "INTEGER NOT NULL DEFAULT 0"),
+    ("usdt_open", "REAL"),
+    ("usdt_min", "REAL"),
+    ("usdt_max", "REAL"),
+]
+COLUMNS = "time, total_usdt, balances, tickers, period, usdt_open, usdt_min, usdt_max"
+
+
+def reports_db_path():
+    return os.path.join(settings.ROOT_PATH, "data", "btbmt_reports.db")
+
+
+class ReportStore:
+    def __init__(self):
+        """
+        Append-only store of the account snapshots, backed by an
+        SQLite table owned by the manager. Each snapshot is one
+        row, so saving a report never rewrites the previous ones.
+        """
+        self.lock = threading.Lock()
+        self.con = None
+        self.path = None
+
+    def _connect(self):
+        path = reports_db_path()
+        if self.con is not None and self.path == path:
+            return self.con
+        if self.con is not None:
+            self.con.close()
+        self.con = sqlite3.connect(path, check_same_thread=False)
+        self.path = path
+        self.con.execute("PRAGMA journal_mode=WAL")
+        self.con.execute(
+            f"PRAGMA synchronous={SYNC_MODES.get(settings.REPORTS_SYNC, 'NORMAL')}"
+        )
+        self.con.execute(
+            """
+            CREATE TABLE IF NOT EXISTS reports (
+                time INTEGER NOT NULL,
+                total_usdt REAL NOT NULL,
+                balances TEXT NOT NULL,
+                tickers TEXT NOT NULL
+            )
+            """
+        )
+        # columns of the rollups made by the retention engine
+        columns = [c[1] for c in self.con.execute("PRAGMA table_info(reports)")]
+        for column, column_type in ROLLUP_COLUMNS:
+            if column not in columns:
+                self.con.execute(
+                    f"ALTER TABLE reports ADD COLUMN {column} {column_type}"
+                )
+        self.con.execute("CREATE INDEX IF NOT EXISTS reports_time ON reports (time)")
+        # the one-time imports already done, see extend_once
+        self.con.execute("CREATE TABLE IF NOT EXISTS imports (key TEXT PRIMARY KEY)")
+        self.con.commit()
+        return self.con
+
+    @staticmethod
+    def _to_row(report):
+        return (
+            int(report["time"]),
+            float(report["total_usdt"]),
+            json.dumps(report["balances"], separators=(",", ":")),
+            json.dumps(report["tickers"], separators=(",", ":")),
+        )
+
+    @staticmethod
+    def _from_row(row):
+        report = {
+            "time": row[0],
+            "total_usdt": row[1],
+            "balances": json.loads(row[2]),
+            "tickers": json.loads(row[3]),
+            "period": row[4],
+        }
+        if row[4] > 0:
+            report["usdt_open"], report["usdt_min"], report["usdt_max"] = row[5:8]
+        return report
+
+    def append(self, report):
+        with self.lock:
+            con = self._connect()
+            with con:
+                con.execute(
+                    "INSERT INTO reports (time, total_usdt, balances, tickers) VALUES (?, ?, ?, ?)",
+                    self._to_row(report),
+                )
+
+    def extend(self, reports):
+        """
+        Append many reports in a single transaction
+        """
+        with self.lock:
+            con = self._connect()
+            with con:
+                con.executemany(
+                    "INSERT INTO reports (time, total_usdt, balances, tickers) VALUES (?, ?, ?, ?)",
+                    (self._to_row(report) for report in reports),
+                )
+
+    def extend_once(self, key, reports):
+        """
+        Append many reports in a single transaction, unless it has already
+        been done for `key`. The key is recorded in the same transaction,
+        so that an interrupted import is neither lost nor done twice.
+        Returns False if the reports had already been imported.
+        """
+        with self.lock:
+            con = self._connect()
+            with con:
+                if (
+                    con.execute(
+                        "SELECT 1 FROM imports WHERE key = ?", (key,)
+                    ).fetchone()
+                    is not None
+                ):
+                    return False
+                con.executemany(
+                    "INSERT INTO reports (time, total_usdt, balances, tickers) VALUES (?, ?, ?, ?)",
+                    (self._to_row(report) for report in reports),
+                )
+                con.execute("INSERT INTO imports (key) VALUES (?)", (key,))
+            return True
+
+    def iter_reports(self, batch_size=500):
+        """
+        Stream the reports in insertion order without loading
+        the whole history at once
+        """
+        last_rowid = 0
+        while True:
+            with self.lock:
+                rows = (
+                    self._connect()
+                    .execute(
+                        f"SELECT rowid, {COLUMNS} FROM reports WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                        (last_rowid, batch_size),
+                    )
+                    .fetchall()
+                )
+            for row in rows:
+                yield self._from_row(row[1:])
+            if len(rows) < batch_size:
+                return
+            last_rowid = rows[-1][0]
+
+    def compact(self, tiers, now, max_buckets=500):
+        """
+        Merges the reports older than each tier age into one rollup per
+        tier resolution. A rollup keeps the open, close, min and max of
+        total_usdt, and the balances and tickers at the end of the period.
+        At most `max_buckets` rollups are made per call, so that the
+        compaction can run incrementally.
+        Returns the number of rollups made.
+        """
+        nb_rollups = 0
+        with self.lock:
+            con = self._connect()
+            with con:
+                for age, resolution in sorted(tiers):
+                    cutoff = now - age
+                    cutoff -= cutoff % resolution
+                    while nb_rollups < max_buckets:
+                        row = con.execute(
+                            "SELECT MIN(time) FROM reports WHERE time < ? AND period < ?",
+                            (cutoff, resolution),
+                        ).fetchone()
+                        if row[0] is None:
+                            break
+                        bucket_start = row[0] - row[0] % resolution
+                        bucket_end = bucket_start + resolution
+                        rows = con.execute(
+                            f"SELECT rowid, {COLUMNS} FROM reports WHERE time >= ? AND time < ? ORDER BY time",
+                            (bucket_start, bucket_end),
+                        ).fetchall()
+                        self._merge(con, rows, resolution)
+                        nb_rollups += 1
+        return nb_rollups
+
+    @staticmethod
+    def _merge(con, rows, resolution):
+        # rows are (rowid, time, total_usdt, balances, tickers, period, open, min, max)
+        first, last = rows[0], rows[-1]
+        usdt_open = first[2] if first[5] == 0 else first[6]
+        usdt_min = min(r[2] if r[5] == 0 else r[7] for r in rows)
+        usdt_max = max(r[2] if r[5] == 0 else r[8] for r in rows)
+        con.executemany(
+            "DELETE FROM reports WHERE rowid = ?", [(r[0],) for r in rows[:-1]]
+        )
+        con.execute(
+            "UPDATE reports SET period = ?, usdt_open = ?, usdt_min = ?, usdt_max = ? WHERE rowid = ?",
+            (
+                max([resolution] + [r[5] for r in rows]),
+                usdt_open,
+                usdt_min,
+                usdt_max,
+                last[0],
+            ),
+        )
+
+    def __len__(self):
+        with self.lock:
+            return self._connect().execute("SELECT COUNT(*) FROM reports").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            if self.con is not None:
+                self.con.close()
+                self.con = None
+                self.path = None
+
+
+report_store = ReportStore()
+
+
+def migrate_npy_reports(npy_path):
+    """
+    One-time migration of the pickled numpy report list
+    to the report store. The numpy file is kept as a backup
+    with a `.migrated` suffix.
+    """
+    reports = np.load(npy_path, allow_pickle=True)
+    logger.info(
+        f"Migrating {len(reports)} reports from `{npy_path}` to the report store"
+    )
+    # the file is left behind if the manager stops before renaming it,
+    # the reports are then not imported again
+    imported = report_store.extend_once(
+        "npy_reports", (r for r in reports if "time" in r)
+    )
+    if not imported:
+        logger.info("The reports had already been migrated")
+    del reports
+    os.replace(npy_path, f"{npy_path}.migrated")
+    logger.info("Reports migration done")
+
+
+def parse_duration(text):
+    """
+    Parses a duration such as `30d` or `4h` into seconds
+    """
+    text = text.strip()
+    if len(text) < 2 or text[-1] not in DURATION_UNITS or not text[:-1].isdigit():
+        raise ValueError(f"Invalid duration `{text}`, expected for example 30d or 4h")
+    return int(text[:-1]) * DURATION_UNITS[text[-1]]
+
+
+def parse_retention(text):
+    """
+    Parses retention tiers such as `30d:4h,365d:1d`: reports older
+    than 30 days are kept every 4 hours, and older than 365 days
+    every day. Returns a list of (age, resolution) in seconds.
+    """
+    tiers = []
+    for tier in text.split(","):
+        if tier.strip() == "":
+            continue
+        if tier.count(":") != 1:
+            raise ValueError(
+                f"Invalid retention tier `{tier}`, expected AGE:RESOLUTION"
+            )
+        age, resolution = tier.split(":")
+        tiers.append((parse_duration(age), parse_duration(resolution)))
+    return tiers
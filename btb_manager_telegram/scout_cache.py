@@ -0,0 +1,95 @@
+import collections
+import threading
+
+from btb_manager_telegram.db_watcher import db_watcher
+from btb_manager_telegram.logging import logger
+
+Scout = collections.namedtuple(
+    "Scout",
+    [
+        "id",
+        "pair_id",
+        "target_ratio",
+        "current_coin_price",
+        "other_coin_price",
+        "datetime",
+    ],
+)
+# newest scout of each pair among the ones added since the last refresh
+LATEST_SCOUTS_QUERY = """SELECT id, pair_id, target_ratio, current_coin_price, other_coin_price, datetime
+FROM scout_history
+WHERE id IN (
+    SELECT MAX(id) FROM scout_history WHERE id > ? GROUP BY pair_id
+)"""
+
+
+class ScoutCache:
+    def __init__(self):
+        """
+        Newest `scout_history` row of each pair. Each refresh only looks
+        at the rows added since the previous one, and lets SQLite keep
+        the newest of them per pair, so the large scout history is never
+        read again. While the database watcher runs, the table is not read
+        at all until it reports a change.
+        """
+        self.lock = threading.Lock()
+        self._clear()
+        db_watcher.subscribe("scout_history", self.invalidate)
+
+    def _clear(self):
+        self.stale = True
+        self.file_id = None
+        self.last_id = 0
+        self.latest = {}
+        self.pairs = {}
+
+    def reset(self):
+        """
+        Forget the cached scouts, e.g. after the scout history was pruned
+        """
+        with self.lock:
+            self._clear()
+
+    def invalidate(self):
+        self.stale = True
+
+    def refresh(self, cur):
+        """
+        `cur` is a cursor of the trade bot database, as given by `get_db_cursor`
+        """
+        with self.lock:
+            file_id = getattr(cur.connection, "source_id", None)
+            if file_id != self.file_id:
+                self._clear()
+                self.file_id = file_id
+            elif not self.stale and db_watcher.is_running():
+                return self
+
+            self.stale = False
+            cur.execute(LATEST_SCOUTS_QUERY, (self.last_id,))
+            scouts = [Scout(*row) for row in cur.fetchall()]
+            for scout in scouts:
+                self.latest[scout.pair_id] = scout
+                self.last_id = max(self.last_id, scout.id)
+
+            if any(scout.pair_id not in self.pairs for scout in scouts):
+                cur.execute("SELECT id, from_coin_id, to_coin_id FROM pairs")
+                self.pairs = {row[0]: row[1:] for row in cur.fetchall()}
+            if len(scouts) > 0:
+                logger.debug(f"{len(scouts)} pairs updated in the scout cache")
+        return self
+
+    def get_latest(self, from_coin):
+        """
+        Returns a dict with the newest scout of each pair
+        from `from_coin`, indexed by the target coin
+        """
+        with self.lock:
+            return {
+                self.pairs[pair_id][1]: scout
+                for pair_id, scout in self.latest.items()
+                if pair_id in self.pairs and self.pairs[pair_id][0] == from_coin
+            }
+
+
+scout_cache = ScoutCache()
@@ -10,6 +10,26 @@ COIN_LIST = None
 CURRENCY = None
 OER_KEY = None
 TLD = None
+BINANCE_API_URL = None
+BINANCE_WEIGHT_LIMIT = 6000
+REPORTS_SYNC = "normal"
+PRERENDER_GRAPHS = 3
+GRAPH_POINTS = 1000
+PRICE_TTL = 10
+REPORT_RETENTION = []
+SCOUT_RETENTION_DAYS = 7
+SCOUT_KEEP_HOURLY = False
+DB_REPLICA_INTERVAL = 0
+DB_WATCH_INTERVAL = 1
+TRADE_NOTIFY_INTERVAL = 30
+WEBHOOK_URL = None
+WEBHOOK_LISTEN = "127.0.0.1"
+WEBHOOK_PORT = 8080
+WEBHOOK_PATH = None
+BOT_API_URL = None
+WORKERS = 4
+CON_POOL_SIZE = None
+JOB_WORKERS = 2
 RAW_ARGS = ""
 
 TG_UPDATE_BROADCASTED_BEFORE = False
@@ -0,0 +1,98 @@
+import json
+import os
+import threading
+
+import i18n
+
+from btb_manager_telegram import settings
+from btb_manager_telegram.buttons import format_progress, format_trade
+from btb_manager_telegram.db_pool import read_pool
+from btb_manager_telegram.formating import escape_tg, telegram_text_truncator
+from btb_manager_telegram.logging import logger
+from btb_manager_telegram.outbox import NOTIFICATION, outbox
+from btb_manager_telegram.trade_stats import trade_stats
+
+
+def notifications_path():
+    return os.path.join("data", "trade_notifications.json")
+
+
+class TradeNotifier:
+    def __init__(self):
+        """
+        Sends a message for the trades completed by the trade bot.
+        `trade_history` is tailed by id through `trade_stats`, and the
+        trades completed between two checks are sent as a single message.
+        """
+        self.lock = threading.Lock()
+        self.enabled = None
+        self.completed = []
+        trade_stats.add_listener(self._on_completed)
+
+    def is_enabled(self):
+        if self.enabled is None:
+            self.enabled = False
+            if os.path.isfile(notifications_path()):
+                with open(notifications_path()) as f:
+                    self.enabled = json.load(f).get("enabled", False)
+        return self.enabled
+
+    def set_enabled(self, enabled):
+        with self.lock:
+            self.enabled = enabled
+            self.completed = []
+        os.makedirs(os.path.dirname(notifications_path()), exist_ok=True)
+        with open(notifications_path(), "w") as f:
+            json.dump({"enabled": enabled}, f)
+
+    def _on_completed(self, completed):
+        if self.is_enabled():
+            with self.lock:
+                self.completed.extend(completed)
+
+    def flush(self):
+        """
+        Sends the trades completed since the last call
+        """
+        with self.lock:
+            completed, self.completed = self.completed, []
+        if len(completed) == 0:
+            return
+
+        m_list = [f"{i18n.t('notification.new_trades', trades=len(completed))}\n\n"]
+        for trade, progress in completed:
+            m_list.append(format_trade(trade))
+            if progress is not None:
+                m_list.append(format_progress(progress))
+        for message in telegram_text_truncator(m_list):
+            outbox.send(
+                settings.CHAT,
+                escape_tg(message),
+                priority=NOTIFICATION,
+                parse_mode="MarkdownV2",
+            )
+        logger.info(f"{len(completed)} trade notification(s) sent.")
+
+
+trade_notifier = TradeNotifier()
+
+
+def check_new_trades():
+    """
+    Scheduled check, which does nothing while the notifications are off.
+    A missing database is not an error here, the trade bot may not have
+    created it yet.
+    """
+    if not trade_notifier.is_enabled():
+        return
+    try:
+        con = read_pool.acquire()
+    except FileNotFoundError:
+        return
+    cur = con.cursor()
+    try:
+        trade_stats.refresh(cur)
+    finally:
+        cur.close()
+        read_pool.release(con)
+    trade_notifier.flush()
@@ -0,0 +1,240 @@
+import collections
+import copy
+import datetime as dt
+import threading
+
+from btb_manager_telegram.db_watcher import db_watcher
+from btb_manager_telegram.logging import logger
+
+COLUMNS = "id, alt_coin_id, crypto_coin_id, selling, state, alt_trade_amount, crypto_trade_amount, datetime"
+# formatted with the placeholders of the pending ids. The rows are sorted
+# afterwards, as ORDER BY makes SQLite scan the table instead of the id ranges
+NEW_TRADES_QUERY = f"SELECT {COLUMNS} FROM trade_history WHERE id > ? OR id IN ({{}})"
+Trade = collections.namedtuple(
+    "Trade",
+    [
+        "id",
+        "alt_coin_id",
+        "crypto_coin_id",
+        "selling",
+        "state",
+        "alt_trade_amount",
+        "crypto_trade_amount",
+        "datetime",
+    ],
+)
+Progress = collections.namedtuple(
+    "Progress", ["coin", "amount", "price", "change", "pre_last_trade_date", "datetime"]
+)
+Summary = collections.namedtuple(
+    "Summary", ["nb_trades", "nb_buys", "first_trade", "first_buy", "last_buy"]
+)
+
+NB_PROGRESS = 15
+NB_RECENT_TRADES = 10
+# trades which are still not complete after this many newer trades
+# are considered failed and are not looked at anymore
+PENDING_HORIZON = 100
+
+
+def parse_date(date):
+    return dt.datetime.strptime(date, "%Y-%m-%d %H:%M:%S.%f")
+
+
+class CoinStats:
+    def __init__(self, coin):
+        self.coin = coin
+        self.jumps = 0
+        self.first_id = None
+        self.first_amount = None
+        self.last_buy = None
+        # time between the buys of the coin and the next buys, the
+        # current coin is held since its last buy in addition
+        self.hold_time = dt.timedelta(0)
+
+    @property
+    def last_amount(self):
+        return None if self.last_buy is None else self.last_buy.alt_trade_amount
+
+    @property
+    def growth(self):
+        """
+        Growth in percent of the amount of coin between the
+        first trade and the last buy, or None
+        """
+        if self.first_amount is None or self.last_buy is None:
+            return None
+        return (self.last_amount - self.first_amount) / self.first_amount * 100
+
+
+class TradeStats:
+    def __init__(self):
+        """
+        Statistics of the trade bot, maintained incrementally from
+        `trade_history`. Each refresh only reads the rows newer than
+        the last processed id, plus the trades still in progress,
+        as a trade is inserted before its order is complete.
+        While the database watcher runs, the table is not read at all
+        until it reports a change.
+        """
+        self.lock = threading.Lock()
+        self.listeners = []
+        self._clear()
+        db_watcher.subscribe("trade_history", self.invalidate)
+
+    def _clear(self):
+        self.stale = True
+        self.loaded = False
+        self.file_id = None
+        self.last_id = 0
+        self.pending = set()
+        self.nb_trades = 0
+        self.nb_buys = 0
+        self.coins = {}
+        self.first_trade = None
+        self.first_buy = None
+        self.last_buy = None
+        self.progress = collections.deque(maxlen=NB_PROGRESS)
+        self.recent_trades = {}
+
+    def refresh(self, cur):
+        """
+        Apply the trades added or completed since the last refresh.
+        `cur` is a cursor of the trade bot database, as given by `get_db_cursor`.
+        """
+        completed = []
+        with self.lock:
+            file_id = getattr(cur.connection, "source_id", None)
+            if file_id != self.file_id:
+                self._clear()
+                self.file_id = file_id
+            elif not self.stale and db_watcher.is_running():
+                return self
+
+            # cleared before reading, so that a change made meanwhile is not missed
+            self.stale = False
+            pending = sorted(self.pending)
+            cur.execute(
+                NEW_TRADES_QUERY.format(",".join("?" * len(pending))),
+                [self.last_id] + pending,
+            )
+            rows = sorted(Trade(*row) for row in cur.fetchall())
+            if len(rows) == 0 and len(pending) == 0 and self.last_id > 0:
+                # the table has been emptied
+                if (
+                    cur.execute("SELECT MAX(id) FROM trade_history").fetchone()[0]
+                    is None
+                ):
+                    self._clear()
+                    self.file_id = file_id
+            for trade in rows:
+                progress = self._apply(trade)
+                if trade.state == "COMPLETE" and self.loaded:
+                    completed.append((trade, progress))
+            self.loaded = True
+            self.pending = {
+                i for i in self.pending if i > self.last_id - PENDING_HORIZON
+            }
+            if len(rows) > 0:
+                logger.debug(f"{len(rows)} trades applied to the statistics")
+        if len(completed) > 0:
+            for callback in self.listeners:
+                callback(completed)
+        return self
+
+    def add_listener(self, callback):
+        """
+        `callback` is called after each refresh with the trades which
+        completed since the previous one, as a list of (trade, progress),
+        `progress` being None for a sell. The trades read by the first
+        refresh, or after a reset, are not reported.
+        """
+        self.listeners.append(callback)
+
+    def invalidate(self):
+        self.stale = True
+
+    def _apply(self, trade):
+        if trade.id > self.last_id:
+            self.last_id = trade.id
+            self.nb_trades += 1
+            self.nb_buys += trade.selling == 0
+
+        if trade.id in self.recent_trades or len(self.recent_trades) < NB_RECENT_TRADES:
+            self.recent_trades[trade.id] = trade
+        elif trade.id > min(self.recent_trades):
+            del self.recent_trades[min(self.recent_trades)]
+            self.recent_trades[trade.id] = trade
+
+        if trade.state != "COMPLETE":
+            self.pending.add(trade.id)
+            return None
+        self.pending.discard(trade.id)
+
+        coin = self.coins.setdefault(trade.alt_coin_id, CoinStats(trade.alt_coin_id))
+        if coin.first_id is None or trade.id < coin.first_id:
+            coin.first_id = trade.id
+            coin.first_amount = trade.alt_trade_amount
+        if self.first_trade is None or trade.id < self.first_trade.id:
+            self.first_trade = trade
+        if trade.selling:
+            return None
+
+        coin.jumps += 1
+        if self.first_buy is None or trade.id < self.first_buy.id:
+            self.first_buy = trade
+        previous = coin.last_buy
+        progress = Progress(
+            trade.alt_coin_id,
+            trade.alt_trade_amount,
+            trade.crypto_trade_amount,
+            None
+            if previous is None
+            else trade.alt_trade_amount - previous.alt_trade_amount,
+            None if previous is None else previous.datetime,
+            trade.datetime,
+        )
+        self.progress.append(progress)
+        if self.last_buy is not None and self.last_buy.id < trade.id:
+            self.coins[self.last_buy.alt_coin_id].hold_time += parse_date(
+                trade.datetime
+            ) - parse_date(self.last_buy.datetime)
+        coin.last_buy = trade
+        self.last_buy = trade
+        return progress
+
+    def get_summary(self):
+        """
+        Number of trades and buys (whatever their state), first
+        complete trade, first and last complete buys
+        """
+        with self.lock:
+            return Summary(
+                self.nb_trades,
+                self.nb_buys,
+                self.first_trade,
+                self.first_buy,
+                self.last_buy,
+            )
+
+    def get_coins(self):
+        with self.lock:
+            return {coin: copy.copy(stats) for coin, stats in self.coins.items()}
+
+    def get_progress(self):
+        """
+        Latest complete buys, oldest first, with the change of amount
+        since the previous buy of the same coin
+        """
+        with self.lock:
+            return list(self.progress)
+
+    def get_recent_trades(self):
+        """
+        Latest trades whatever their state, newest first
+        """
+        with self.lock:
+            return [self.recent_trades[i] for i in sorted(self.recent_trades)[::-1]]
+
+
+trade_stats = TradeStats()
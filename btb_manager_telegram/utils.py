@@ -2,7 +2,6 @@ import configparser
 import datetime as dt
 import json
 import os
-import sqlite3
 import subprocess
 
 import i18n
@@ -10,8 +9,10 @@ import psutil
 import yaml
 
 from btb_manager_telegram import settings
+from btb_manager_telegram.db_pool import read_pool, trade_db_path
 from btb_manager_telegram.formating import escape_tg
 from btb_manager_telegram.logging import logger
+from btb_manager_telegram.outbox import NOTIFICATION, outbox
 from btb_manager_telegram.schedule import scheduler
 
 
@@ -25,22 +26,22 @@ def setup_i18n(lang):
 
 def get_db_cursor(fun):
     def _f_get_db_cursor(*args, **kwargs):
-        db_file_path = os.path.join(settings.ROOT_PATH, "data/crypto_trading.db")
-        if os.path.isfile(db_file_path):
-            try:
-                con = sqlite3.connect(db_file_path)
-                cur = con.cursor()
-            except Exception as e:
-                logger.error(
-                    f"Cannot connect to database, even if the file has been found."
-                )
-                return
-            result = fun(*args, **kwargs, cur=cur)
-            con.close()
-            return result
-        else:
-            logger.error(f"The database file cannot be found at `{db_file_path}`")
+        try:
+            con = read_pool.acquire()
+        except FileNotFoundError:
+            logger.error(f"The database file cannot be found at `{trade_db_path()}`")
+            return
+        except Exception as e:
+            logger.error(
+                f"Cannot connect to database, even if the file has been found."
+            )
             return
+        cur = con.cursor()
+        try:
+            return fun(*args, **kwargs, cur=cur)
+        finally:
+            cur.close()
+            read_pool.release(con)
 
     return _f_get_db_cursor
 
@@ -160,6 +161,8 @@ def find_and_kill_binance_trade_bot_process():
 
 
 def kill_btb_manager_telegram_process():
+    # send the queued messages first
+    outbox.stop()
     try:
         btb_manager_telegram_pid = os.getpid()
         btb_manager_telegram_process = psutil.Process(btb_manager_telegram_pid)
@@ -218,7 +221,12 @@ def update_checker():
             message = f"{i18n.t('update.tgb.available', current_version=cur_vers, remote_version=rem_vers)}\n\n{i18n.t('update.tgb.instruction')}"
             print(message)
             settings.TG_UPDATE_BROADCASTED_BEFORE = True
-            settings.CHAT.send_message(escape_tg(message), parse_mode="MarkdownV2")
+            outbox.send(
+                settings.CHAT,
+                escape_tg(message),
+                priority=NOTIFICATION,
+                parse_mode="MarkdownV2",
+            )
 
     if settings.BTB_UPDATE_BROADCASTED_BEFORE is False:
         if is_btb_bot_update_available():
@@ -228,7 +236,12 @@ def update_checker():
                 f"{i18n.t('update.btb.instruction')}"
             )
             settings.BTB_UPDATE_BROADCASTED_BEFORE = True
-            settings.CHAT.send_message(escape_tg(message), parse_mode="MarkdownV2")
+            outbox.send(
+                settings.CHAT,
+                escape_tg(message),
+                priority=NOTIFICATION,
+                parse_mode="MarkdownV2",
+            )
 
 
 def get_custom_scripts_keyboard():
@@ -0,0 +1,150 @@
+import http.server
+import threading
+import time
+import types
+
+import pytest
+
+from btb_manager_telegram import binance_api_utils, settings
+from btb_manager_telegram.binance_api_utils import (
+    HIGH_PRIORITY,
+    LOW_PRIORITY,
+    WeightLimiter,
+    get_api_url,
+    http_session,
+    request_priority,
+)
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+            status, headers = server.responses.pop(0) if server.responses else (200, {})
+        self.send_response(status)
+        self.send_header("X-MBX-USED-WEIGHT-1M", str(server.used_weight))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.lock = threading.Lock()
+    server.requests = []
+    server.responses = []
+    server.used_weight = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(
+        settings, "BINANCE_API_URL", f"http://127.0.0.1:{server.server_port}"
+    )
+    monkeypatch.setattr(settings, "BINANCE_WEIGHT_LIMIT", 100)
+    monkeypatch.setattr(binance_api_utils, "weight_limiter", WeightLimiter())
+    # the clock starts 10 seconds into a minute, so that the weight
+    # used is not reset by a new minute during a test
+    offset = 10 - time.time() % 60
+    monkeypatch.setattr(
+        binance_api_utils,
+        "time",
+        types.SimpleNamespace(time=lambda: time.time() + offset),
+    )
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get(symbol):
+    return http_session.get(f"{get_api_url()}/api/v3/ticker/price?symbol={symbol}")
+
+
+def test_used_weight_follows_the_header(server):
+    server.used_weight = 42
+    get("BTCUSDT")
+    assert binance_api_utils.weight_limiter.used == 42
+    server.used_weight = 47
+    get("BTCUSDT")
+    assert binance_api_utils.weight_limiter.used == 47
+
+    # the weight of the requests is counted until binance reports it
+    server.used_weight = 0
+    get("BTCUSDT")
+    assert binance_api_utils.weight_limiter.used == 49
+
+
+def test_too_many_requests_pause_for_retry_after(server):
+    server.responses.append((429, {"Retry-After": "1"}))
+    assert get("BTCUSDT").status_code == 429
+    start = time.monotonic()
+    assert get("ETHUSDT").status_code == 200
+    assert time.monotonic() - start >= 0.9
+    assert server.requests[-1].endswith("ETHUSDT")
+
+
+def test_low_priority_waits_while_high_priority_goes_through(server):
+    # above the share of the low priority, below the one of the panic button
+    server.used_weight = 60
+    get("BTCUSDT")
+
+    def _low():
+        with request_priority(LOW_PRIORITY):
+            get("LOWUSDT")
+
+    low = threading.Thread(target=_low, daemon=True)
+    low.start()
+    time.sleep(0.3)
+    with request_priority(HIGH_PRIORITY):
+        assert get("HIGHUSDT").status_code == 200
+    low.join(0.3)
+    assert low.is_alive()
+    assert server.requests[-1].endswith("HIGHUSDT")
+
+    # the low priority request goes once there is weight left
+    limiter = binance_api_utils.weight_limiter
+    with limiter.cond:
+        limiter.used = 0
+        limiter.cond.notify_all()
+    low.join(5)
+    assert not low.is_alive()
+    assert server.requests[-1].endswith("LOWUSDT")
+
+
+def test_high_priority_goes_first_after_a_ban(server, monkeypatch):
+    server.responses.append((418, {"Retry-After": "1"}))
+    get("BTCUSDT")
+
+    # the requests are sent concurrently once acquired, so the order
+    # they are let through is taken from the limiter, not the server
+    limiter = binance_api_utils.weight_limiter
+    acquired = []
+    acquire = limiter.acquire
+
+    def _acquire(weight, priority):
+        # the condition lock is reentrant and released while waiting
+        with limiter.cond:
+            acquire(weight, priority)
+            acquired.append(priority)
+
+    monkeypatch.setattr(limiter, "acquire", _acquire)
+
+    def _get(priority, symbol):
+        with request_priority(priority):
+            get(symbol)
+
+    threads = [
+        threading.Thread(target=_get, args=(LOW_PRIORITY, "LOWUSDT"), daemon=True),
+        threading.Thread(target=_get, args=(HIGH_PRIORITY, "HIGHUSDT"), daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.1)
+    for thread in threads:
+        thread.join(5)
+    assert acquired == [HIGH_PRIORITY, LOW_PRIORITY]
@@ -0,0 +1,48 @@
+import sqlite3
+
+import pytest
+
+from btb_manager_telegram.db_tools import advised_queries, review_indexes
+
+# tables of the trade bot read by the manager
+SCHEMA = """
+CREATE TABLE trade_history (id INTEGER NOT NULL PRIMARY KEY, alt_coin_id VARCHAR, crypto_coin_id VARCHAR, selling BOOLEAN, state VARCHAR(9), alt_starting_balance FLOAT, alt_trade_amount FLOAT, crypto_starting_balance FLOAT, crypto_trade_amount FLOAT, datetime DATETIME);
+CREATE TABLE coin_value (id INTEGER NOT NULL PRIMARY KEY, coin_id VARCHAR, balance FLOAT, usd_price FLOAT, btc_price FLOAT, interval VARCHAR, datetime DATETIME);
+CREATE TABLE scout_history (id INTEGER NOT NULL PRIMARY KEY, pair_id INTEGER, target_ratio FLOAT, current_coin_price FLOAT, other_coin_price FLOAT, datetime DATETIME);
+"""
+
+
+@pytest.fixture
+def con():
+    con = sqlite3.connect(":memory:")
+    con.executescript(SCHEMA)
+    yield con
+    con.close()
+
+
+def test_advises_the_indexes_used_by_the_queries(con):
+    missing, unneeded = review_indexes(con, advised_queries())
+    assert [index[0] for index in missing] == [
+        "btbmt_trade_history_datetime",
+        "btbmt_coin_value_coin",
+    ]
+    assert unneeded == []
+
+
+def test_reports_the_indexes_slowing_down_the_queries(con):
+    # scanning this index replaces the id range lookup of the newest scouts
+    con.execute(
+        "CREATE INDEX btbmt_scout_history_pair ON scout_history (pair_id, datetime)"
+    )
+    con.execute("CREATE INDEX btbmt_coin_value_coin ON coin_value (coin_id, datetime)")
+    con.execute("CREATE INDEX other_index ON scout_history (pair_id)")
+    missing, unneeded = review_indexes(con, advised_queries())
+    assert [index[0] for index in missing] == ["btbmt_trade_history_datetime"]
+    assert unneeded == ["btbmt_scout_history_pair"]
+
+
+def test_ignores_the_missing_tables(con):
+    con.execute("DROP TABLE coin_value")
+    con.execute("ANALYZE")
+    missing, _ = review_indexes(con, advised_queries())
+    assert [index[0] for index in missing] == ["btbmt_trade_history_datetime"]
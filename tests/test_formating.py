@@ -0,0 +1,32 @@
+from btb_manager_telegram.formating import split_escaped_message
+
+
+def test_short_message_is_not_split():
+    assert split_escaped_message("a\nb", length=10) == ["a\nb"]
+
+
+def test_split_between_lines():
+    lines = [f"line {i}" for i in range(20)]
+    messages = split_escaped_message("\n".join(lines), length=30)
+    assert len(messages) > 1
+    assert all(len(m) <= 30 for m in messages)
+    assert "\n".join(messages).split("\n") == lines
+
+
+def test_code_block_is_closed_and_reopened():
+    message = "title\n```\n" + "\n".join(f"code {i}" for i in range(20)) + "\n```"
+    messages = split_escaped_message(message, length=40)
+    assert len(messages) > 1
+    for m in messages:
+        assert len(m) <= 40
+        assert m.count("```") % 2 == 0
+    assert messages[1].startswith("```\n")
+
+
+def test_long_line_is_not_cut_after_a_backslash():
+    line = "a" * 9 + "\\." + "b" * 30
+    messages = split_escaped_message(line, length=20)
+    assert "".join(m.replace("\n", "") for m in messages) == line
+    for m in messages:
+        assert all(len(part) <= 20 for part in m.split("\n"))
+        assert not m.endswith("\\")
@@ -0,0 +1,74 @@
+import concurrent.futures
+import threading
+
+import pytest
+
+from btb_manager_telegram import settings
+from btb_manager_telegram.jobs import MAINTENANCE, JobExecutor
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    monkeypatch.setattr(settings, "JOB_WORKERS", 1)
+    return JobExecutor()
+
+
+def blocking_job(started, release, result=None):
+    def _job():
+        started.set()
+        release.wait(5)
+        return result
+
+    return _job
+
+
+def test_same_key_is_coalesced(executor):
+    started, release = threading.Event(), threading.Event()
+    calls = []
+    first = executor.submit("key", blocking_job(started, release, "done"))
+    started.wait(5)
+    second = executor.submit("key", lambda: calls.append(1))
+    assert second is first
+    release.set()
+    assert first.result(5) == "done"
+    assert calls == []
+
+    # a finished job runs again
+    assert executor.submit("key", lambda: "again").result(5) == "again"
+
+
+def test_priority(executor):
+    started, release = threading.Event(), threading.Event()
+    order = []
+    executor.submit("blocking", blocking_job(started, release))
+    started.wait(5)
+    low = executor.submit("low", lambda: order.append("low"), MAINTENANCE)
+    high = executor.submit("high", lambda: order.append("high"))
+    release.set()
+    concurrent.futures.wait([low, high], 5)
+    assert order == ["high", "low"]
+
+
+def test_cancel_only_the_queued_jobs(executor):
+    started, release = threading.Event(), threading.Event()
+    calls = []
+    running = executor.submit("running", blocking_job(started, release, "done"))
+    started.wait(5)
+    queued = executor.submit("queued", lambda: calls.append(1))
+    assert executor.cancel() == (1, 1)
+    assert queued.cancelled()
+
+    release.set()
+    # the running job completes with its result
+    assert running.result(5) == "done"
+    assert executor.submit("after", lambda: "after").result(5) == "after"
+    assert calls == []
+    assert executor.cancel() == (0, 0)
+
+
+def test_error_is_set_on_the_future(executor):
+    def _fail():
+        raise ValueError("failed")
+
+    with pytest.raises(ValueError):
+        executor.submit("fail", _fail).result(5)
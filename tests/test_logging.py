@@ -0,0 +1,47 @@
+import pytest
+
+from btb_manager_telegram import logging as btbmt_logging
+from btb_manager_telegram.logging import LogForwarder
+
+
+@pytest.fixture
+def forwarder(monkeypatch):
+    forwarder = LogForwarder()
+    # the logs are collected by the test instead of the thread
+    monkeypatch.setattr(forwarder, "start", lambda: None)
+    return forwarder
+
+
+def test_repeated_logs_are_counted(forwarder, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(btbmt_logging.time, "monotonic", lambda: now[0])
+    for _ in range(3):
+        forwarder.put("error")
+    forwarder.put("other")
+    assert forwarder._collect() == ["error", "other"]
+
+    now[0] += btbmt_logging.LOG_DEDUP_WINDOW
+    forwarder.queue.put("new")
+    texts = forwarder._collect()
+    assert texts[0] == "new"
+    assert texts[1].startswith("error\n×2 in last")
+    # the repeated log gets a new window, the other one is forgotten
+    assert list(forwarder.seen) == ["error"]
+
+
+def test_dropped_logs_are_not_remembered(forwarder):
+    forwarder.queue.maxsize = 2
+    for i in range(5):
+        forwarder.put(f"error {i}")
+    assert list(forwarder.seen) == ["error 0", "error 1"]
+    texts = forwarder._collect()
+    assert texts[:2] == ["error 0", "error 1"]
+    assert "3 logs dropped" in texts[2]
+
+
+def test_seen_logs_are_bounded(forwarder, monkeypatch):
+    monkeypatch.setattr(btbmt_logging, "LOG_DEDUP_SIZE", 3)
+    for i in range(5):
+        forwarder.put(f"error {i}")
+        forwarder._collect()
+    assert list(forwarder.seen) == ["error 2", "error 3", "error 4"]
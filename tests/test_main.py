@@ -0,0 +1,135 @@
+import http.server
+import json
+import queue
+import socket
+import threading
+import time
+import urllib.request
+
+import pytest
+import telegram
+import telegram.ext
+
+from btb_manager_telegram import settings
+from btb_manager_telegram.__main__ import start_updates
+
+TOKEN = "123456:TEST"
+
+
+class BotApiHandler(http.server.BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        method = self.path.rsplit("/", 1)[-1]
+        self.server.calls.append(method)
+        if method == "getUpdates":
+            # as a long poll, so that the updater does not spin
+            time.sleep(0.05)
+            body = {"ok": True, "result": []}
+        else:
+            body = self.server.responses.get(method, {"ok": True, "result": True})
+        data = json.dumps(body).encode()
+        self.send_response(200 if body["ok"] else body["error_code"])
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def bot_api():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), BotApiHandler)
+    server.calls = []
+    server.responses = {
+        "getMe": {
+            "ok": True,
+            "result": {"id": 123456, "is_bot": True, "first_name": "btbmt"},
+        }
+    }
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def updater(bot_api, monkeypatch):
+    monkeypatch.setattr(settings, "TOKEN", TOKEN)
+    monkeypatch.setattr(settings, "WEBHOOK_URL", "https://example.com/tg/")
+    monkeypatch.setattr(settings, "WEBHOOK_LISTEN", "127.0.0.1")
+    monkeypatch.setattr(settings, "WEBHOOK_PORT", free_port())
+    monkeypatch.setattr(settings, "WEBHOOK_PATH", "updates")
+    updater = telegram.ext.Updater(
+        TOKEN, base_url=f"http://127.0.0.1:{bot_api.server_port}/bot"
+    )
+    yield updater
+    updater.stop()
+
+
+def wait_for(condition, timeout=5):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end
+        time.sleep(0.02)
+
+
+def test_updates_through_the_webhook(bot_api, updater):
+    # the dispatcher is started with the webhook and consumes the update queue
+    received = queue.Queue()
+    updater.dispatcher.add_handler(
+        telegram.ext.TypeHandler(
+            telegram.Update, lambda update, context: received.put(update)
+        )
+    )
+    start_updates(updater)
+    assert "setWebhook" in bot_api.calls
+    assert updater.httpd is not None
+
+    update = {
+        "update_id": 1,
+        "message": {
+            "message_id": 1,
+            "date": 0,
+            "chat": {"id": 42, "type": "private"},
+            "text": "/start",
+        },
+    }
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{settings.WEBHOOK_PORT}/updates",
+        data=json.dumps(update).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    urllib.request.urlopen(request, timeout=5).close()
+    update = received.get(timeout=5)
+    assert update.update_id == 1
+    assert update.message.text == "/start"
+    assert "getUpdates" not in bot_api.calls
+
+
+def test_polling_when_the_port_is_busy(bot_api, updater):
+    with socket.socket() as sock:
+        sock.bind((settings.WEBHOOK_LISTEN, settings.WEBHOOK_PORT))
+        sock.listen()
+        start_updates(updater)
+        wait_for(lambda: "getUpdates" in bot_api.calls)
+    assert updater.httpd is None
+    assert "setWebhook" not in bot_api.calls
+
+
+def test_polling_when_the_webhook_is_rejected(bot_api, updater):
+    bot_api.responses["setWebhook"] = {
+        "ok": False,
+        "error_code": 400,
+        "description": "Bad Request: bad webhook",
+    }
+    start_updates(updater)
+    wait_for(lambda: "getUpdates" in bot_api.calls)
+    assert updater.httpd is None
@@ -0,0 +1,121 @@
+import time
+import types
+
+import pytest
+import telegram
+
+from btb_manager_telegram import outbox
+from btb_manager_telegram.outbox import (
+    INTERACTIVE,
+    LOG,
+    NOTIFICATION,
+    Outbox,
+    TokenBucket,
+)
+
+
+def test_burst_then_rate():
+    bucket = TokenBucket(rate=2, capacity=3)
+    now = bucket.last
+    for _ in range(3):
+        assert bucket.delay(now) == 0
+        bucket.take(now)
+    # a token comes back every 1 / rate seconds
+    assert bucket.delay(now) == pytest.approx(0.5)
+    assert bucket.delay(now + 0.25) == pytest.approx(0.25)
+    assert bucket.delay(now + 0.5) == 0
+
+
+def test_tokens_do_not_exceed_the_capacity():
+    bucket = TokenBucket(rate=1, capacity=2)
+    now = bucket.last + 100
+    bucket.take(now)
+    bucket.take(now)
+    assert bucket.delay(now) == pytest.approx(1)
+
+
+def test_block():
+    bucket = TokenBucket(rate=1, capacity=5)
+    bucket.block(3)
+    # no token for 3 seconds, whatever the tokens left
+    assert bucket.delay(bucket.last) == pytest.approx(3)
+    assert bucket.delay(bucket.last + 3) == 0
+
+
+class FakeBot:
+    def __init__(self, failures=()):
+        self.sent = []
+        self.failures = list(failures)
+
+    def send_message(self, chat_id, text, **kwargs):
+        if self.failures:
+            raise self.failures.pop(0)
+        self.sent.append(text)
+        return types.SimpleNamespace(chat_id=chat_id, text=text)
+
+
+@pytest.fixture
+def chat(monkeypatch):
+    # no per chat limit, so that only the queue order matters
+    monkeypatch.setattr(outbox, "CHAT_RATE", 1000)
+    monkeypatch.setattr(outbox, "CHAT_BURST", 1000)
+    return types.SimpleNamespace(id=42, bot=FakeBot())
+
+
+def test_sent_by_priority(chat):
+    box = Outbox()
+    box.send(chat, "log", priority=LOG, mergeable=False)
+    box.send(chat, "notification", priority=NOTIFICATION, mergeable=False)
+    box.send(chat, "interactive", priority=INTERACTIVE, mergeable=False)
+    box.start()
+    box.stop()
+    assert chat.bot.sent == ["interactive", "notification", "log"]
+
+
+def test_adjacent_messages_are_merged(chat):
+    box = Outbox()
+    futures = [box.send(chat, text) for text in ("a", "b", "c")]
+    # a different priority is not merged
+    futures.append(box.send(chat, "d", priority=LOG))
+    box.start()
+    box.stop()
+    assert chat.bot.sent == ["a\nb\nc", "d"]
+    # every merged message resolves to the message sent
+    assert [f.result(0).text for f in futures] == ["a\nb\nc"] * 3 + ["d"]
+    assert box.get_metrics()["merged"] == 2
+
+
+def test_merged_up_to_the_message_length(chat):
+    box = Outbox()
+    long = "x" * (telegram.constants.MAX_MESSAGE_LENGTH - 2)
+    box.send(chat, long)
+    box.send(chat, "a")
+    box.send(chat, "b")
+    box.start()
+    box.stop()
+    assert chat.bot.sent == [f"{long}\na", "b"]
+
+
+def test_requeued_after_retry_after(chat):
+    chat.bot.failures.append(telegram.error.RetryAfter(1))
+    box = Outbox()
+    start = time.monotonic()
+    futures = [box.send(chat, "a"), box.send(chat, "b")]
+    box.start()
+    assert [f.result(5).text for f in futures] == ["a\nb"] * 2
+    assert time.monotonic() - start >= 0.9
+    box.stop()
+    assert chat.bot.sent == ["a\nb"]
+    assert box.get_metrics()["retries"] == 1
+
+
+def test_failure_is_set_on_every_future(chat):
+    chat.bot.failures.append(telegram.error.BadRequest("bad"))
+    box = Outbox()
+    futures = [box.send(chat, "a"), box.send(chat, "b")]
+    box.start()
+    box.stop()
+    for future in futures:
+        with pytest.raises(telegram.error.BadRequest):
+            future.result(0)
+    assert box.get_metrics()["failed"] == 1
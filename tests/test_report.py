@@ -0,0 +1,27 @@
+import numpy as np
+
+from btb_manager_telegram.report import downsample
+
+
+def test_downsample_short_series_is_kept():
+    assert list(downsample([3, 1, 2], 10)) == [0, 1, 2]
+
+
+def test_downsample_keeps_the_ends_and_the_extrema():
+    y = np.random.default_rng(0).random(1001)
+    kept = downsample(y, 10)
+    assert kept[0] == 0
+    assert kept[-1] == len(y) - 1
+    assert len(kept) <= 12
+    assert np.argmin(y) in kept
+    assert np.argmax(y) in kept
+
+
+def test_downsample_fills_every_bucket():
+    # 12 points in 5 buckets, a rounded up bucket size of 3 would leave the last one empty
+    y = np.arange(12)
+    kept = downsample(y, 10)
+    bounds = np.linspace(0, len(y), 6).astype(int)
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        assert start in kept
+        assert end - 1 in kept
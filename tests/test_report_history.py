@@ -0,0 +1,45 @@
+import numpy as np
+
+from btb_manager_telegram.report_history import ReportHistory
+
+
+def report(time, symbols):
+    return {
+        "time": time,
+        "total_usdt": float(time),
+        "tickers": {s: float(time) for s in symbols},
+        "balances": {s: 1.0 for s in symbols},
+    }
+
+
+def loaded_history():
+    history = ReportHistory()
+    # the store is not read, the reports are added by the test
+    history.loaded = True
+    return history
+
+
+def test_new_symbols_do_not_grow_the_rows():
+    history = loaded_history()
+    for i in range(800):
+        history.add(report(i, ["BTC"] + [f"COIN{j}" for j in range(i // 100)]))
+    rows, cols = history.prices.shape
+    assert rows < 2 * 800
+    assert 8 <= cols < 2 * 8
+    window = history.window()
+    assert len(window.times) == 800
+    assert window.prices.shape == (800, 8)
+    assert window.prices[799, window.symbols["COIN6"]] == 799
+    assert np.isnan(window.prices[0, window.symbols["COIN6"]])
+
+
+def test_windows_are_not_changed_by_a_late_report():
+    history = loaded_history()
+    for time in [10, 20, 30]:
+        history.add(report(time, ["BTC"]))
+    window = history.window()
+    history.add(report(15, ["BTC"]))
+    assert list(window.times) == [10, 20, 30]
+    assert list(window.prices[:, 0]) == [10, 20, 30]
+    assert list(history.window().times) == [10, 15, 20, 30]
+    assert list(history.window(start=12, end=25).total_usdt) == [15, 20]
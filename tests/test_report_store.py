@@ -0,0 +1,132 @@
+import os
+
+import numpy as np
+import pytest
+
+from btb_manager_telegram import report_store, settings
+from btb_manager_telegram.report_store import (
+    ReportStore,
+    migrate_npy_reports,
+    parse_duration,
+    parse_retention,
+)
+
+HOUR = 3600
+DAY = 86400
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    (tmp_path / "data").mkdir()
+    monkeypatch.setattr(settings, "ROOT_PATH", str(tmp_path))
+    store = ReportStore()
+    yield store
+    store.close()
+
+
+def report(time, total_usdt):
+    return {
+        "time": time,
+        "total_usdt": total_usdt,
+        "balances": [["BTC", total_usdt]],
+        "tickers": {"BTC": 1},
+    }
+
+
+def test_parse_duration():
+    assert parse_duration("30d") == 30 * DAY
+    assert parse_duration(" 4h ") == 4 * HOUR
+    with pytest.raises(ValueError):
+        parse_duration("4")
+    with pytest.raises(ValueError):
+        parse_duration("1.5h")
+
+
+def test_parse_retention():
+    assert parse_retention("30d:4h,365d:1d") == [(30 * DAY, 4 * HOUR), (365 * DAY, DAY)]
+    assert parse_retention("") == []
+    assert parse_retention("30d:4h,") == [(30 * DAY, 4 * HOUR)]
+    with pytest.raises(ValueError):
+        parse_retention("30d")
+    with pytest.raises(ValueError):
+        parse_retention("30d:4h:1d")
+
+
+def test_compact_merges_old_reports(store):
+    now = 10 * DAY
+    # two hourly buckets of three reports each, then recent reports
+    store.extend(
+        report(t, v)
+        for t, v in [
+            (0, 10),
+            (600, 5),
+            (1200, 7),
+            (HOUR, 20),
+            (HOUR + 600, 30),
+            (HOUR + 1200, 25),
+            (now - 600, 40),
+            (now - 300, 50),
+        ]
+    )
+    assert store.compact([(DAY, HOUR)], now) == 2
+    reports = list(store.iter_reports())
+    assert len(reports) == 4
+
+    first, second = reports[0], reports[1]
+    # the rollups keep the last report of each bucket
+    assert (first["time"], first["total_usdt"], first["period"]) == (1200, 7, HOUR)
+    assert (first["usdt_open"], first["usdt_min"], first["usdt_max"]) == (10, 5, 10)
+    assert second["time"] == HOUR + 1200
+    assert (second["usdt_open"], second["usdt_min"], second["usdt_max"]) == (20, 20, 30)
+    # the recent reports are untouched
+    assert [r["period"] for r in reports[2:]] == [0, 0]
+    assert [r["total_usdt"] for r in reports[2:]] == [40, 50]
+
+    # nothing left to compact
+    assert store.compact([(DAY, HOUR)], now) == 0
+
+
+def test_compact_merges_rollups_into_coarser_tiers(store):
+    now = 100 * DAY
+    store.extend(report(t * HOUR, t % 5) for t in range(48))
+    assert store.compact([(DAY, HOUR)], now) == 48
+    assert store.compact([(DAY, HOUR), (10 * DAY, DAY)], now) == 2
+    reports = list(store.iter_reports())
+    assert [r["period"] for r in reports] == [DAY, DAY]
+    assert [(r["usdt_open"], r["usdt_min"], r["usdt_max"]) for r in reports] == [
+        (0, 0, 4),
+        (4, 0, 4),
+    ]
+    assert reports[-1]["total_usdt"] == 47 % 5
+
+
+def test_compact_is_incremental(store):
+    now = 100 * DAY
+    store.extend(report(t * HOUR, t) for t in range(10))
+    assert store.compact([(DAY, 2 * HOUR)], now, max_buckets=3) == 3
+    assert store.compact([(DAY, 2 * HOUR)], now, max_buckets=3) == 2
+    assert len(store) == 5
+
+
+def test_migration_is_not_done_twice(store, tmp_path, monkeypatch):
+    monkeypatch.setattr(report_store, "report_store", store)
+    npy_path = str(tmp_path / "data" / "btbmt_reports.npy")
+    reports = [report(i * HOUR, 100 + i) for i in range(5)]
+    np.save(npy_path, np.array(reports, dtype=object), allow_pickle=True)
+
+    # the manager stops after the reports are stored, before the rename
+    def crash(*args):
+        raise KeyboardInterrupt
+
+    replace = os.replace
+    monkeypatch.setattr(os, "replace", crash)
+    with pytest.raises(KeyboardInterrupt):
+        migrate_npy_reports(npy_path)
+    monkeypatch.setattr(os, "replace", replace)
+    assert len(store) == 5
+
+    migrate_npy_reports(npy_path)
+    assert len(store) == 5
+    assert [r["time"] for r in store.iter_reports()] == [r["time"] for r in reports]
+    assert not os.path.exists(npy_path)
+    assert os.path.exists(f"{npy_path}.migrated")
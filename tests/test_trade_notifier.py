@@ -0,0 +1,31 @@
+import logging
+
+import pytest
+
+from btb_manager_telegram import settings, trade_notifier
+from btb_manager_telegram.db_pool import read_pool
+
+
+@pytest.fixture
+def notifier(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "ROOT_PATH", str(tmp_path))
+    monkeypatch.setattr(settings, "DB_REPLICA_INTERVAL", 0)
+    monkeypatch.setattr(trade_notifier.trade_notifier, "enabled", False)
+    read_pool.close()
+    yield trade_notifier.trade_notifier
+    read_pool.close()
+
+
+def test_disabled_notifications_do_not_read_the_database(notifier, monkeypatch):
+    def _acquire():
+        raise AssertionError("the database was read")
+
+    monkeypatch.setattr(read_pool, "acquire", _acquire)
+    trade_notifier.check_new_trades()
+
+
+def test_missing_database_is_not_logged(notifier, monkeypatch, caplog):
+    monkeypatch.setattr(notifier, "enabled", True)
+    with caplog.at_level(logging.WARNING):
+        trade_notifier.check_new_trades()
+    assert caplog.records == []
@@ -0,0 +1,233 @@
+import datetime as dt
+import random
+import sqlite3
+
+import pytest
+
+from btb_manager_telegram.trade_stats import TradeStats, parse_date
+
+COINS = ["ADA", "BTT", "DOGE", "XLM"]
+
+# the queries which trade_stats replaced
+PROGRESS_QUERY = """
+SELECT *
+FROM (
+    SELECT
+        th1.alt_coin_id AS coin,
+        th1.alt_trade_amount AS amount,
+        th1.crypto_trade_amount AS priceInUSD,
+        (
+            th1.alt_trade_amount - (
+                SELECT th2.alt_trade_amount
+                FROM trade_history th2
+                WHERE
+                    th2.state = 'COMPLETE'
+                    AND th2.alt_coin_id = th1.alt_coin_id
+                    AND th1.datetime > th2.datetime
+                    AND th2.selling = 0
+                    ORDER BY th2.datetime DESC LIMIT 1
+            )
+        ) AS change,
+        (
+            SELECT th2.datetime
+            FROM trade_history th2
+            WHERE
+                th2.state = 'COMPLETE'
+                AND th2.alt_coin_id = th1.alt_coin_id
+                AND th1.datetime > th2.datetime
+                AND th2.selling = 0
+                ORDER BY th2.datetime DESC LIMIT 1
+        ) AS pre_last_trade_date,
+        datetime
+    FROM trade_history th1
+    WHERE
+        th1.state = 'COMPLETE'
+        AND th1.selling = 0
+    ORDER BY th1.datetime DESC LIMIT 15
+)
+ORDER BY datetime ASC
+"""
+HISTORY_QUERY = "SELECT alt_coin_id, crypto_coin_id, selling, state, alt_trade_amount, crypto_trade_amount, datetime FROM trade_history ORDER BY datetime DESC LIMIT 10"
+COIN_QUERY = """
+WITH coins AS (
+    SELECT alt_coin_id,
+        SUM(selling=0) AS jumps,
+        MIN(id) AS first_id,
+        MAX(CASE WHEN selling=0 THEN id END) AS last_buy_id
+    FROM trade_history
+    WHERE state='COMPLETE'
+    GROUP BY alt_coin_id
+)
+SELECT coins.alt_coin_id, coins.jumps, first.alt_trade_amount, last.alt_trade_amount
+FROM coins
+JOIN trade_history AS first ON first.id = coins.first_id
+JOIN trade_history AS last ON last.id = coins.last_buy_id
+"""
+
+
+@pytest.fixture
+def con():
+    con = sqlite3.connect(":memory:")
+    con.execute(
+        """
+        CREATE TABLE trade_history (
+            id INTEGER PRIMARY KEY,
+            alt_coin_id TEXT,
+            crypto_coin_id TEXT,
+            selling BOOLEAN,
+            state TEXT,
+            alt_trade_amount FLOAT,
+            crypto_trade_amount FLOAT,
+            datetime DATETIME
+        )
+        """
+    )
+    yield con
+    con.close()
+
+
+class History:
+    def __init__(self, con):
+        self.con = con
+        self.random = random.Random(0)
+        self.date = dt.datetime(2021, 1, 1)
+
+    def add(self, nb_trades, complete=True):
+        ids = []
+        for _ in range(nb_trades):
+            self.date += dt.timedelta(minutes=self.random.randint(1, 600))
+            cur = self.con.execute(
+                "INSERT INTO trade_history (alt_coin_id, crypto_coin_id, selling, state, alt_trade_amount, crypto_trade_amount, datetime) VALUES (?, 'USDT', ?, ?, ?, ?, ?)",
+                (
+                    self.random.choice(COINS),
+                    self.random.random() < 0.5,
+                    "COMPLETE" if complete else "STARTING",
+                    self.random.uniform(1, 1000),
+                    self.random.uniform(10, 100),
+                    self.date.strftime("%Y-%m-%d %H:%M:%S.%f"),
+                ),
+            )
+            ids.append(cur.lastrowid)
+        return ids
+
+    def complete(self, ids):
+        self.con.executemany(
+            "UPDATE trade_history SET state = 'COMPLETE' WHERE id = ?",
+            [(i,) for i in ids],
+        )
+
+
+def check(stats, con):
+    assert [tuple(p) for p in stats.get_progress()] == con.execute(
+        PROGRESS_QUERY
+    ).fetchall()
+    assert [tuple(t[1:]) for t in stats.get_recent_trades()] == con.execute(
+        HISTORY_QUERY
+    ).fetchall()
+
+    summary = stats.get_summary()
+    assert (summary.nb_trades, summary.nb_buys) == con.execute(
+        "SELECT COUNT(*), SUM(selling=0) FROM trade_history"
+    ).fetchone()
+    assert (
+        summary.first_trade.id
+        == con.execute(
+            "SELECT id FROM trade_history WHERE state='COMPLETE' ORDER BY id ASC LIMIT 1"
+        ).fetchone()[0]
+    )
+    assert (
+        summary.last_buy.id
+        == con.execute(
+            "SELECT id FROM trade_history WHERE selling=0 and state='COMPLETE' ORDER BY id DESC LIMIT 1"
+        ).fetchone()[0]
+    )
+
+    coins = {
+        coin: (c.jumps, c.first_amount, c.last_amount)
+        for coin, c in stats.get_coins().items()
+        if c.last_buy is not None
+    }
+    assert coins == {coin: tuple(values) for coin, *values in con.execute(COIN_QUERY)}
+
+    # each coin is held from its buy to the next buy
+    buys = con.execute(
+        "SELECT alt_coin_id, datetime FROM trade_history WHERE selling=0 AND state='COMPLETE' ORDER BY id"
+    ).fetchall()
+    hold_times = {coin: dt.timedelta(0) for coin in coins}
+    for (coin, start), (_, end) in zip(buys, buys[1:]):
+        hold_times[coin] += parse_date(end) - parse_date(start)
+    assert {
+        coin: c.hold_time for coin, c in stats.get_coins().items() if coin in coins
+    } == hold_times
+
+
+def test_matches_the_queries(con):
+    history = History(con)
+    stats = TradeStats()
+    history.add(50)
+    check(stats.refresh(con.cursor()), con)
+
+    # a trade is inserted before its order is complete, and completed
+    # before the next one is inserted, unless it failed
+    history.add(1, complete=False)
+    history.add(3)
+    pending = history.add(1, complete=False)
+    check(stats.refresh(con.cursor()), con)
+    history.complete(pending)
+    check(stats.refresh(con.cursor()), con)
+    history.add(2)
+    check(stats.refresh(con.cursor()), con)
+
+
+def test_reports_the_completed_trades(con):
+    history = History(con)
+    stats = TradeStats()
+    completed = []
+    stats.add_listener(completed.extend)
+
+    history.add(10)
+    stats.refresh(con.cursor())
+    # the trades read by the first refresh are not reported
+    assert completed == []
+
+    pending = history.add(1, complete=False)
+    stats.refresh(con.cursor())
+    assert completed == []
+    history.complete(pending)
+    new = history.add(2)
+    stats.refresh(con.cursor())
+    assert [trade.id for trade, _ in completed] == pending + new
+    for trade, progress in completed:
+        assert (progress is None) == bool(trade.selling)
+
+
+def test_emptied_table_resets_the_stats(con):
+    history = History(con)
+    stats = TradeStats()
+    history.add(10)
+    stats.refresh(con.cursor())
+    con.execute("DELETE FROM trade_history")
+    stats.refresh(con.cursor())
+    assert stats.get_summary().nb_trades == 0
+    history.add(4)
+    check(stats.refresh(con.cursor()), con)
+
+
+def test_hold_time(con):
+    stats = TradeStats()
+    for coin, selling, date in [
+        ("ADA", 0, "2021-01-01 00:00:00.000000"),
+        ("ADA", 1, "2021-01-01 10:00:00.000000"),
+        ("XLM", 0, "2021-01-01 10:00:01.000000"),
+        ("XLM", 1, "2021-01-02 10:00:00.000000"),
+        ("ADA", 0, "2021-01-02 10:00:01.000000"),
+    ]:
+        con.execute(
+            "INSERT INTO trade_history (alt_coin_id, crypto_coin_id, selling, state, alt_trade_amount, crypto_trade_amount, datetime) VALUES (?, 'USDT', ?, 'COMPLETE', 1, 1, ?)",
+            (coin, selling, date),
+        )
+        # refreshed after each trade, the hold time is maintained incrementally
+        stats.refresh(con.cursor())
+    coins = stats.get_coins()
+    assert coins["ADA"].hold_time == dt.timedelta(hours=10, seconds=1)
+    assert coins["XLM"].hold_time == dt.timedelta(days=1)